@@ -0,0 +1,92 @@
+"""
+Concurrent insert benchmark for ``OrderedModel.order_lock``.
+
+Runs several threads creating ``Answer`` objects, either all for the same
+question or each for a question of its own, with and without ``order_lock``.
+Reports the insert throughput, failed inserts and the number of duplicate
+``(question, order)`` pairs left in the table.
+
+SQLite serializes all writers, so only PostgreSQL or MySQL (selected through
+the environment, see ``benchmarks/settings.py``) show the throughput scaling
+across groups.
+
+    $ python -m benchmarks.concurrency --threads 8 --inserts 200
+"""
+import threading
+from optparse import OptionParser
+
+from benchmarks.utils import setup_database, teardown_database, Timer
+
+
+def insert_answers(question_id, count, errors):
+    from django.db import connection, DatabaseError
+    from ordered_model.tests.models import Answer
+    for i in range(count):
+        try:
+            Answer.objects.create(question_id=question_id)
+        except DatabaseError:
+            errors.append(question_id)
+            connection.close()
+    connection.close()
+
+
+def run(threads, inserts, same_group, lock):
+    from django.db.models import Count
+    from ordered_model.tests.models import Answer, Question
+
+    Answer.objects.all().delete()
+    Question.objects.all().delete()
+    Answer.order_lock = lock
+    if same_group:
+        question_ids = [Question.objects.create().pk] * threads
+    else:
+        question_ids = [Question.objects.create().pk for i in range(threads)]
+
+    errors = []
+    workers = [
+        threading.Thread(target=insert_answers, args=(question_id, inserts, errors))
+        for question_id in question_ids
+    ]
+    with Timer() as timer:
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+
+    duplicates = (Answer.objects.order_by().values('question', 'order')
+                  .annotate(n=Count('pk')).filter(n__gt=1).count())
+    created = Answer.objects.count()
+    return {
+        'groups': 'same' if same_group else 'different',
+        'order_lock': lock,
+        'threads': threads,
+        'inserts': created,
+        'errors': len(errors),
+        'duplicates': duplicates,
+        'seconds': timer.elapsed,
+        'inserts_per_second': created / timer.elapsed if timer.elapsed else 0,
+    }
+
+
+def main():
+    parser = OptionParser()
+    parser.add_option('--threads', type='int', default=8)
+    parser.add_option('--inserts', type='int', default=100,
+                      help='inserts per thread')
+    options, args = parser.parse_args()
+
+    old_name = setup_database()
+    try:
+        print('%-10s %-10s %8s %8s %10s %12s' % (
+            'groups', 'order_lock', 'inserts', 'errors', 'duplicates', 'inserts/s'))
+        for same_group in (True, False):
+            for lock in (False, True):
+                result = run(options.threads, options.inserts, same_group, lock)
+                print('%(groups)-10s %(order_lock)-10s %(inserts)8d %(errors)8d '
+                      '%(duplicates)10d %(inserts_per_second)12.1f' % result)
+    finally:
+        teardown_database(old_name)
+
+
+if __name__ == '__main__':
+    main()
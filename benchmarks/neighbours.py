@@ -0,0 +1,55 @@
+"""
+Neighbour lookup benchmark for the composite ``(question, order)`` index of
+``Answer``.
+
+Fills one question per group size with answers and times the lookup of the
+previous answer that ``up()`` runs, at random positions in the group. With
+the composite index the latency stays flat as the groups grow; without it the
+database reads all answers of the question and sorts them.
+
+    $ python -m benchmarks.neighbours --sizes 10,1000,100000 --lookups 500
+"""
+import random
+from optparse import OptionParser
+
+from benchmarks.utils import setup_database, teardown_database, Timer
+
+
+def run(size, lookups):
+    from ordered_model.tests.models import Answer, Question
+
+    question = Question.objects.create()
+    Answer.objects.bulk_create([Answer(question=question) for i in range(size)], batch_size=500)
+    orders = [random.randint(0, size) for i in range(lookups)]
+    with Timer() as timer:
+        for order in orders:
+            list(Answer.objects.filter(question=question, order__lt=order)
+                 .order_by('-order').values_list('pk', flat=True)[:1])
+    return {
+        'size': size,
+        'lookups': lookups,
+        'seconds': timer.elapsed,
+        'microseconds_per_lookup': timer.elapsed / lookups * 1e6,
+    }
+
+
+def main():
+    parser = OptionParser()
+    parser.add_option('--sizes', default='10,100,1000,10000,100000',
+                      help='comma separated group sizes')
+    parser.add_option('--lookups', type='int', default=200,
+                      help='lookups per group size')
+    options, args = parser.parse_args()
+
+    old_name = setup_database()
+    try:
+        print('%10s %8s %12s' % ('group size', 'lookups', 'us/lookup'))
+        for size in [int(size) for size in options.sizes.split(',')]:
+            result = run(size, options.lookups)
+            print('%(size)10d %(lookups)8d %(microseconds_per_lookup)12.1f' % result)
+    finally:
+        teardown_database(old_name)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,209 @@
+"""
+Benchmark suite timing every ordering operation across group sizes and
+database backends.
+
+For every size the ``Item``, ``Answer`` and ``PizzaToppingsThroughModel``
+test models get a group of that many objects, then the middle object of the
+group is created, moved ``up()``/``down()``, ``to()`` the top, ``above()`` the
+first object, ``below()`` the last one, to the ``top()``/``bottom()`` and up
+through the admin ``move_view``, and the admin order controls of up to 1000
+objects of the group are rendered for models registered in the test admin.
+Each operation records its wall time, the number of queries and the number of
+rows written.
+
+Every backend runs in a process of its own. PostgreSQL is configured with the
+``BENCHMARK_DB_*`` environment variables of ``benchmarks/settings.py`` and
+skipped when it can't be reached. ``--output`` writes the results as JSON,
+which ``--compare`` reads to show the changes of a later run:
+
+    $ python -m benchmarks.run --sizes 10,10000 --output before.json
+    $ python -m benchmarks.run --sizes 10,10000 --compare before.json
+"""
+import json
+import os
+import platform
+import subprocess
+import sys
+from optparse import OptionParser, SUPPRESS_HELP
+
+from benchmarks.utils import setup_database, teardown_database, Recorder
+
+ENGINES = {
+    'sqlite': 'django.db.backends.sqlite3',
+    'postgresql': 'django.db.backends.postgresql_psycopg2',
+}
+
+MODELS = ('Item', 'Answer', 'PizzaToppingsThroughModel')
+
+OPERATIONS = ('create', 'up', 'down', 'to', 'above', 'below', 'top', 'bottom', 'move_view', 'controls')
+
+
+def new_group(name):
+    """
+    Return the field values of the objects of a new group of the test model
+    ``name``, emptying the table of ``Item`` which has no groups.
+    """
+    from ordered_model.tests.models import Item, Pizza, Question, Topping
+    if name == 'Item':
+        Item.objects.all().delete()
+        return {'name': 'item'}
+    if name == 'Answer':
+        return {'question': Question.objects.create()}
+    return {'pizza': Pizza.objects.create(name='pizza'),
+            'topping': Topping.objects.create(name='topping')}
+
+
+def seed(model, values, size, chunk_size=10000):
+    for i in range(0, size, chunk_size):
+        model.objects.bulk_create([model(**values) for j in range(min(chunk_size, size - i))],
+                                  batch_size=300)
+
+
+def run_operation(model, values, operation, model_admin, request):
+    """
+    Run ``operation`` on the middle object of the group of ``values`` and
+    return its measurements.
+    """
+    group = model.objects.filter(**values).order_by('order', 'pk')
+    count = group.count()
+    middle = group[count // 2]
+    first = group[0]
+    last = group[count - 1]
+    if operation == 'controls':
+        objs = list(group[:1000])
+    with Recorder() as recorder:
+        if operation == 'create':
+            model.objects.create(**values)
+        elif operation == 'to':
+            middle.to(first.order)
+        elif operation == 'above':
+            middle.above(first)
+        elif operation == 'below':
+            middle.below(last)
+        elif operation == 'move_view':
+            model_admin.move_view(request, str(middle.pk), 'up')
+        elif operation == 'controls':
+            for obj in objs:
+                model_admin.move_up_down_links(obj)
+        else:
+            getattr(middle, operation)()
+    return {
+        'operation': operation,
+        'seconds': recorder.elapsed,
+        'queries': recorder.queries,
+        'rows_written': recorder.rows_written,
+    }
+
+
+def run(sizes, names):
+    from django.contrib import admin
+    from django.contrib.auth.models import User
+    from django.db import connection
+    from django.test.client import RequestFactory
+    from ordered_model.admin import OrderedModelAdmin
+    from ordered_model.tests import models
+    import ordered_model.tests.admin  # registers the admin of Item
+
+    request = RequestFactory().get('/')
+    request.user = User.objects.create_superuser('benchmark', 'benchmark@example.com', 'benchmark')
+    results = []
+    for size in sizes:
+        for name in names:
+            model = getattr(models, name)
+            values = new_group(name)
+            seed(model, values, size)
+            model_admin = OrderedModelAdmin(model, admin.site)
+            for operation in OPERATIONS:
+                if operation == 'controls' and model not in admin.site._registry:
+                    # the controls link to the admin views of the model
+                    continue
+                result = run_operation(model, values, operation, model_admin, request)
+                result.update({'backend': connection.vendor, 'model': name, 'size': size})
+                results.append(result)
+    return results
+
+
+def run_backend(backend, options):
+    """
+    Run the benchmarks on ``backend`` in a child process, returning its
+    results or None if the backend isn't available.
+    """
+    env = os.environ.copy()
+    env['BENCHMARK_DB_ENGINE'] = ENGINES[backend]
+    if backend != 'sqlite':
+        env.setdefault('BENCHMARK_DB_NAME', 'ordered_model')
+    process = subprocess.Popen(
+        [sys.executable, '-m', 'benchmarks.run', '--backend', backend,
+         '--sizes', options.sizes, '--models', options.models],
+        stdout=subprocess.PIPE, stderr=subprocess.PIPE, env=env)
+    stdout, stderr = process.communicate()
+    if process.returncode:
+        lines = stderr.decode('utf-8', 'replace').strip().splitlines()
+        sys.stderr.write('%s skipped: %s\n' % (backend, lines[-1] if lines else process.returncode))
+        return None
+    return json.loads(stdout.decode('utf-8'))
+
+
+def key(result):
+    return (result['backend'], result['model'], result['size'], result['operation'])
+
+
+def print_results(results, previous=None):
+    previous = dict((key(result), result) for result in previous or [])
+    print('%-10s %-26s %8s %-10s %10s %8s %12s' % (
+        'backend', 'model', 'size', 'operation', 'ms', 'queries', 'rows written'))
+    for result in results:
+        line = '%(backend)-10s %(model)-26s %(size)8d %(operation)-10s %(ms)10.2f %(queries)8d %(rows_written)12d' % dict(
+            result, ms=result['seconds'] * 1000)
+        old = previous.get(key(result))
+        if old:
+            line += '   %+7.1f%% %+4d queries %+8d rows' % (
+                (result['seconds'] / old['seconds'] - 1) * 100 if old['seconds'] else 0,
+                result['queries'] - old['queries'], result['rows_written'] - old['rows_written'])
+        print(line)
+
+
+def main():
+    parser = OptionParser()
+    parser.add_option('--sizes', default='10,10000,1000000',
+                      help='comma separated group sizes')
+    parser.add_option('--models', default=','.join(MODELS),
+                      help='comma separated test models')
+    parser.add_option('--backends', default='sqlite,postgresql',
+                      help='comma separated backends, of %s' % ', '.join(sorted(ENGINES)))
+    parser.add_option('--output', help='file to write the results to as JSON')
+    parser.add_option('--compare', help='JSON file of an earlier run to compare with')
+    parser.add_option('--backend', help=SUPPRESS_HELP)  # runs one backend, see run_backend()
+    options, args = parser.parse_args()
+    sizes = [int(size) for size in options.sizes.split(',')]
+    names = options.models.split(',')
+
+    if options.backend:
+        old_name = setup_database()
+        try:
+            results = run(sizes, names)
+        finally:
+            teardown_database(old_name)
+        sys.stdout.write(json.dumps(results))
+        return
+
+    results = []
+    for backend in options.backends.split(','):
+        results.extend(run_backend(backend, options) or [])
+    previous = None
+    if options.compare:
+        with open(options.compare) as f:
+            previous = json.load(f)['results']
+    print_results(results, previous)
+    if options.output:
+        import django
+        with open(options.output, 'w') as f:
+            json.dump({
+                'python': platform.python_version(),
+                'django': django.get_version(),
+                'results': results,
+            }, f, indent=1, sort_keys=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,32 @@
+# Settings for the benchmarks, based on the test settings.
+#
+# The database can be chosen with environment variables, e.g. for PostgreSQL:
+#
+#   BENCHMARK_DB_ENGINE=django.db.backends.postgresql_psycopg2 \
+#   BENCHMARK_DB_NAME=ordered_model BENCHMARK_DB_USER=postgres \
+#   python -m benchmarks.concurrency
+#
+# SQLite uses a file instead of an in-memory database so that several threads
+# can share it.
+import os
+import tempfile
+
+from ordered_model.tests.settings import *
+
+ENGINE = os.environ.get('BENCHMARK_DB_ENGINE', 'django.db.backends.sqlite3')
+
+DATABASES = {
+    'default': {
+        'ENGINE': ENGINE,
+        'NAME': os.environ.get('BENCHMARK_DB_NAME', ''),
+        'USER': os.environ.get('BENCHMARK_DB_USER', ''),
+        'PASSWORD': os.environ.get('BENCHMARK_DB_PASSWORD', ''),
+        'HOST': os.environ.get('BENCHMARK_DB_HOST', ''),
+        'PORT': os.environ.get('BENCHMARK_DB_PORT', ''),
+    }
+}
+
+if ENGINE.endswith('sqlite3'):
+    DATABASES['default']['TEST_NAME'] = os.path.join(
+        tempfile.gettempdir(), 'ordered_model_benchmark.sqlite3')
+    DATABASES['default']['OPTIONS'] = {'timeout': 30}
@@ -0,0 +1,55 @@
+import os
+import time
+
+
+def setup_database():
+    """
+    Configure Django and create a fresh benchmark database. Returns the name
+    of the original database, to be passed to ``teardown_database()``.
+    """
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'benchmarks.settings')
+    from django.db import connection
+    old_name = connection.settings_dict['NAME']
+    connection.creation.create_test_db(verbosity=0, autoclobber=True)
+    return old_name
+
+
+def teardown_database(old_name):
+    from django.db import connection
+    connection.creation.destroy_test_db(old_name, verbosity=0)
+
+
+class Timer(object):
+    """
+    Context manager measuring the wall time of its block in ``elapsed``.
+    """
+
+    def __enter__(self):
+        self.start = time.time()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.elapsed = time.time() - self.start
+
+
+class Recorder(object):
+    """
+    Context manager measuring the wall time of its block in ``elapsed``, the
+    number of queries it runs in ``queries`` and the number of rows written
+    by its ``INSERT``, ``UPDATE`` and ``DELETE`` statements in
+    ``rows_written``, on the default database.
+    """
+
+    def __enter__(self):
+        from django.db import connection
+        from ordered_model.models import _StatementCounter
+        self._counter = _StatementCounter(connection)
+        self._counter.__enter__()
+        self.start = time.time()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.elapsed = time.time() - self.start
+        self._counter.__exit__(*exc_info)
+        self.queries = self._counter.statements
+        self.rows_written = self._counter.rows_written
@@ -1,20 +1,148 @@
+import json
 from functools import update_wrapper
 
 # from django.conf import settings
-from django.core.paginator import Paginator
-from django.core.urlresolvers import reverse
-from django.http import HttpResponseRedirect
+from django.core.exceptions import PermissionDenied, ValidationError
+from django.core.paginator import InvalidPage, Paginator
+from django.core.urlresolvers import get_script_prefix, reverse
+from django.db import router
+from django.http import HttpResponse, HttpResponseNotAllowed, HttpResponseRedirect
 from django.shortcuts import get_object_or_404
+from django.utils.html import escape
 # from django.utils.html import strip_spaces_between_tags as short
 from django.utils.translation import ugettext_lazy as _
 from django.template.loader import render_to_string
 from django.contrib import admin
-from django.contrib.admin.util import unquote
+from django.contrib.admin.util import quote, unquote
+from django.contrib.admin.options import IncorrectLookupParameters
 from django.contrib.admin.views.main import ChangeList
 
+from ordered_model.models import atomic
+from ordered_model.paginator import KeysetPaginator
+
+AFTER_VAR = 'after'
+BEFORE_VAR = 'before'
+
+
+# The order controls rendered once per admin class, model and URL prefix,
+# with placeholders for the values of each object.
+_order_controls = {}
+_ID = '__ordered_model_id__'
+_URL_ID = '__ordered_model_url_id__'
+_URL_GROUP = '__ordered_model_url_group__'
+_QUERY_STRING = '__ordered_model_query_string__'
+
+
+def _render_order_controls(model_admin, obj, args, url_suffix='', group=None):
+    """
+    Return the order controls of ``obj`` from the cached rendering of the
+    controls template, substituting its primary key, the ``group`` of an
+    inline and the query string of the change list. ``args`` are the
+    placeholders of the arguments of the move URLs.
+    """
+    key = (model_admin.__class__, model_admin.model, get_script_prefix())
+    controls = _order_controls.get(key)
+    if controls is None:
+        url_name = 'admin:{app}_{model}_order_%s'.format(**model_admin.get_model_info()) + url_suffix
+        controls = render_to_string("ordered_model/admin/order_controls.html", {
+            'app_label': model_admin.model._meta.app_label,
+            'module_name': model_admin.model._meta.module_name,
+            'object_id': _ID,
+            'urls': {
+                'up': reverse(url_name % 'up', args=args + ['up']),
+                'down': reverse(url_name % 'down', args=args + ['down']),
+            },
+            'query_string': _QUERY_STRING,
+        })
+        _order_controls[key] = controls
+    controls = controls.replace(_ID, escape(obj.pk)).replace(_URL_ID, escape(quote(u'%s' % obj.pk)))
+    if group is not None:
+        controls = controls.replace(_URL_GROUP, escape(quote(u'%s' % group)))
+    return controls.replace(_QUERY_STRING, escape(model_admin.request_query_string))
+
+
+def _move(obj, direction):
+    if direction == 'up':
+        obj.up()
+    else:
+        obj.down()
+
+
+def _query_string(request):
+    return '?%s' % request.GET.urlencode() if request.GET else ''
+
+
+class KeysetChangeList(ChangeList):
+    """
+    A ``ChangeList`` paginated by a ``KeysetPaginator``, which reads the
+    cursor of the page from the ``after`` or ``before`` query parameter
+    instead of the page number. The objects are listed in stack order.
+    """
+
+    def __init__(self, request, *args, **kwargs):
+        self.after = request.GET.get(AFTER_VAR)
+        self.before = request.GET.get(BEFORE_VAR)
+        GET = request.GET
+        if self.after is not None or self.before is not None:
+            # the cursor is no filter of the changelist
+            request.GET = GET.copy()
+            request.GET.pop(AFTER_VAR, None)
+            request.GET.pop(BEFORE_VAR, None)
+        try:
+            super(KeysetChangeList, self).__init__(request, *args, **kwargs)
+        finally:
+            request.GET = GET
+
+    def get_results(self, request):
+        if hasattr(self, 'queryset'):
+            queryset, root_queryset = self.queryset, self.root_queryset
+        else:  # Django < 1.6
+            queryset, root_queryset = self.query_set, self.root_query_set
+        paginator = self.model_admin.get_paginator(request, queryset, self.list_per_page)
+        try:
+            self.page = paginator.page(after=self.after, before=self.before)
+        except InvalidPage:
+            raise IncorrectLookupParameters
+        self.result_count = paginator.count
+        if not queryset.query.where:
+            self.full_result_count = self.result_count
+        else:
+            self.full_result_count = root_queryset.count()
+        self.result_list = self.page.object_list
+        # there are no page numbers to show, see keyset_change_list.html
+        self.can_show_all = False
+        self.multi_page = False
+        self.paginator = paginator
+        self.cursor_params = {}
+        if self.after is not None:
+            self.cursor_params[AFTER_VAR] = self.after
+        elif self.before is not None:
+            self.cursor_params[BEFORE_VAR] = self.before
+
+    def get_next_page_url(self):
+        if self.page.has_next():
+            return self.get_query_string({AFTER_VAR: self.page.next_cursor()}, [BEFORE_VAR])
+
+    def get_previous_page_url(self):
+        if self.page.has_previous():
+            return self.get_query_string({BEFORE_VAR: self.page.previous_cursor()}, [AFTER_VAR])
+
 
 class OrderedModelAdmin(admin.ModelAdmin):
 
+    class Media:
+        js = ('ordered_model/js/reorder.js',)
+
+    def __init__(self, *args, **kwargs):
+        super(OrderedModelAdmin, self).__init__(*args, **kwargs)
+        if issubclass(self.paginator, KeysetPaginator) and not self.change_list_template:
+            self.change_list_template = 'ordered_model/admin/keyset_change_list.html'
+
+    def get_changelist(self, request, **kwargs):
+        if issubclass(self.paginator, KeysetPaginator):
+            return KeysetChangeList
+        return super(OrderedModelAdmin, self).get_changelist(request, **kwargs)
+
     def get_model_info(self):
         return dict(app=self.model._meta.app_label,
                     model=self.model._meta.module_name)
@@ -32,13 +160,16 @@ class OrderedModelAdmin(admin.ModelAdmin):
 
                         url(r'^(.+)/move-(down)/$', wrap(self.move_view),
                             name='{app}_{model}_order_down'.format(**self.get_model_info())),
+
+                        url(r'^reorder/$', wrap(self.reorder_view),
+                            name='{app}_{model}_reorder'.format(**self.get_model_info())),
                         ) + super(OrderedModelAdmin, self).get_urls()
 
     def _get_changelist(self, request):
         list_display = self.get_list_display(request)
         list_display_links = self.get_list_display_links(request, list_display)
 
-        cl = ChangeList(request, self.model, list_display,
+        cl = self.get_changelist(request)(request, self.model, list_display,
                         list_display_links, self.list_filter, self.date_hierarchy,
                         self.search_fields, self.list_select_related,
                         self.list_per_page, self.list_max_show_all, self.list_editable,
@@ -50,29 +181,44 @@ class OrderedModelAdmin(admin.ModelAdmin):
 
     def changelist_view(self, request, extra_context=None):
         cl = self._get_changelist(request)
-        self.request_query_string = cl.get_query_string()
+        self.request_query_string = cl.get_query_string(getattr(cl, 'cursor_params', {}))
         return super(OrderedModelAdmin, self).changelist_view(request, extra_context)
 
     def move_view(self, request, object_id, direction):
-        cl = self._get_changelist(request)
-        qs = cl.get_query_set(request)
-
+        if not self.has_change_permission(request):
+            raise PermissionDenied
         obj = get_object_or_404(self.model, pk=unquote(object_id))
-        obj.move(direction, qs)
+        _move(obj, direction)
+        # the links carry the filters of the change list
+        return HttpResponseRedirect('../../%s' % _query_string(request))
 
-        return HttpResponseRedirect('../../%s' % self.request_query_string)
+    def reorder_view(self, request):
+        """
+        Apply a move made by drag and drop on the change list and return the
+        new orders of the objects whose position changed as JSON. Takes
+        either the primary key of an ``object`` and the ``position`` to move
+        it to in its stack, or the primary keys of objects of one stack as
+        ``ids`` in their new order, which swap their orders among themselves.
+        """
+        if request.method != 'POST':
+            return HttpResponseNotAllowed(['POST'])
+        if not self.has_change_permission(request):
+            raise PermissionDenied
+        try:
+            if 'ids' in request.POST:
+                orders = self.model._default_manager.reorder(request.POST.getlist('ids'))
+            else:
+                with atomic(using=router.db_for_write(self.model)):
+                    obj = get_object_or_404(self.model, pk=unquote(request.POST['object']))
+                    orders = obj._to_position(int(request.POST['position']))
+        except (KeyError, ValueError, ValidationError) as e:
+            return HttpResponse(json.dumps({'error': u'%s' % e}), status=400,
+                                content_type='application/json')
+        orders = dict((u'%s' % pk, order) for pk, order in orders.items())
+        return HttpResponse(json.dumps({'orders': orders}), content_type='application/json')
 
     def move_up_down_links(self, obj):
-        return render_to_string("ordered_model/admin/order_controls.html", {
-            'app_label': self.model._meta.app_label,
-            'module_name': self.model._meta.module_name,
-            'object_id': obj.id,
-            'urls': {
-                'up': reverse("admin:{app}_{model}_order_up".format(**self.get_model_info()), args=[obj.id, 'up']),
-                'down': reverse("admin:{app}_{model}_order_down".format(**self.get_model_info()), args=[obj.id, 'down']),
-            },
-            'query_string': self.request_query_string
-        })
+        return _render_order_controls(self, obj, [_URL_ID])
     move_up_down_links.allow_tags = True
     move_up_down_links.short_description = _(u'Move')
 
@@ -133,12 +279,18 @@ class OrderedTabularInline(admin.TabularInline):
             # Use only the first item in list_display as link
             return list(list_display)[:1]
 
+    @classmethod
+    def get_changelist(cls, request, **kwargs):
+        if issubclass(cls.paginator, KeysetPaginator):
+            return KeysetChangeList
+        return ChangeList
+
     @classmethod
     def _get_changelist(cls, request):
         list_display = cls.get_list_display(request)
         list_display_links = cls.get_list_display_links(request, list_display)
 
-        cl = ChangeList(request, cls.model, list_display,
+        cl = cls.get_changelist(request)(request, cls.model, list_display,
                         list_display_links, cls.list_filter, cls.date_hierarchy,
                         cls.search_fields, cls.list_select_related,
                         cls.list_per_page, cls.list_max_show_all, cls.list_editable,
@@ -151,7 +303,7 @@ class OrderedTabularInline(admin.TabularInline):
     @classmethod
     def changelist_view(cls, request, extra_context=None):
         cl = cls._get_changelist(request)
-        cls.request_query_string = cl.get_query_string()
+        cls.request_query_string = cl.get_query_string(getattr(cl, 'cursor_params', {}))
         return super(OrderedTabularInline, cls).changelist_view(request, extra_context)
 
     @classmethod
@@ -180,26 +332,17 @@ class OrderedTabularInline(admin.TabularInline):
 
     @classmethod
     def move_view(cls, request, admin_id, object_id, direction):
-        cl = cls._get_changelist(request)
-        qs = cl.get_query_set(request)
-
+        opts = cls.model._meta
+        if not request.user.has_perm('%s.%s' % (opts.app_label, opts.get_change_permission())):
+            raise PermissionDenied
         obj = get_object_or_404(cls.model, pk=unquote(object_id))
-        obj.move(direction, qs)
-
-        return HttpResponseRedirect('../../../%s' % cls.request_query_string)
+        _move(obj, direction)
+        return HttpResponseRedirect('../../../%s' % _query_string(request))
 
     def move_up_down_links(self, obj):
-        if obj.id:
-            return render_to_string("ordered_model/admin/order_controls.html", {
-                'app_label': self.model._meta.app_label,
-                'module_name': self.model._meta.module_name,
-                'object_id': obj.id,
-                'urls': {
-                    'up': reverse("admin:{app}_{model}_order_up_inline".format(**self.get_model_info()), args=[obj._get_order_with_respect_to().id, obj.id, 'up']),
-                    'down': reverse("admin:{app}_{model}_order_down_inline".format(**self.get_model_info()), args=[obj._get_order_with_respect_to().id, obj.id, 'down']),
-                },
-                'query_string': self.request_query_string
-            })
+        if obj.pk:
+            return _render_order_controls(self, obj, [_URL_GROUP, _URL_ID], '_inline',
+                                          obj._get_ordering_key()[0])
         else:
             return ''
     move_up_down_links.allow_tags = True
@@ -0,0 +1,46 @@
+"""
+An in-process cache for the positional index of ``OrderedModel.order_cache``.
+"""
+import threading
+
+try:
+    from collections import OrderedDict
+except ImportError:  # Python < 2.7
+    from django.utils.datastructures import SortedDict as OrderedDict
+
+
+class LRUCache(object):
+    """
+    A thread-safe cache keeping the ``maxsize`` most recently used values,
+    with the ``get``/``set``/``delete`` methods of Django's cache backends.
+    Values are shared, not copied, so they must not be modified.
+    """
+
+    def __init__(self, maxsize=1000):
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            try:
+                value = self._data.pop(key)
+            except KeyError:
+                return default
+            self._data[key] = value
+            return value
+
+    def set(self, key, value, timeout=None):
+        with self._lock:
+            self._data.pop(key, None)
+            self._data[key] = value
+            while len(self._data) > self.maxsize:
+                del self._data[next(iter(self._data))]
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
@@ -0,0 +1,128 @@
+"""
+Helpers for the composite index and the unique constraint on the
+``order_with_respect_to`` field and the ``order`` of an ordered model.
+
+``syncdb`` creates the index for new tables by itself. Add it to an existing
+table with ``add_order_index()``, e.g. from a South migration.
+
+Declare the constraint with ``unique_together`` to have ``syncdb`` create it,
+or add it to an existing table with ``add_order_constraint()``. On PostgreSQL
+the constraint created by these helpers is ``DEFERRABLE`` when the model sets
+``order_constraint_deferrable``.
+"""
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+from django.db.backends.util import truncate_name
+from django.db.models import Count
+
+
+def order_index_name(model, connection):
+    return truncate_name('%s_order_idx' % model._meta.db_table,
+                         connection.ops.max_name_length())
+
+
+def order_constraint_name(model, connection):
+    return truncate_name('%s_order_uniq' % model._meta.db_table,
+                         connection.ops.max_name_length())
+
+
+def _order_constraint_columns(model):
+    column_names = dict((f.attname, f.column) for f in model._meta.fields)
+    attnames = model._get_order_with_respect_to_attnames() + ['order']
+    return [column_names[attname] for attname in attnames]
+
+
+def sql_create_order_index(model, using=DEFAULT_DB_ALIAS):
+    """
+    Return the SQL statements creating the composite index on the
+    ``order_with_respect_to`` column and the ``order`` column of ``model``.
+    """
+    connection = connections[using]
+    qn = connection.ops.quote_name
+    columns = ', '.join([qn(column) for column in _order_constraint_columns(model)])
+    return ['CREATE INDEX %s ON %s (%s);' % (
+        qn(order_index_name(model, connection)), qn(model._meta.db_table), columns)]
+
+
+def add_order_index(model, using=DEFAULT_DB_ALIAS):
+    """
+    Create the composite index on the ``order_with_respect_to`` column and
+    the ``order`` column of ``model``.
+    """
+    _execute(sql_create_order_index(model, using), using)
+
+
+def order_index_exists(model, using=DEFAULT_DB_ALIAS):
+    """
+    Return whether the composite index created by ``add_order_index()``
+    exists, on the databases shipped with Django.
+    """
+    connection = connections[using]
+    name = order_index_name(model, connection)
+    queries = {
+        'sqlite': ("SELECT 1 FROM sqlite_master WHERE type = 'index' AND name = %s", [name]),
+        'postgresql': ('SELECT 1 FROM pg_indexes WHERE indexname = %s', [name]),
+        'mysql': ('SELECT 1 FROM information_schema.statistics WHERE table_schema = DATABASE() '
+                  'AND table_name = %s AND index_name = %s', [model._meta.db_table, name]),
+        'oracle': ('SELECT 1 FROM user_indexes WHERE index_name = %s', [name.upper()]),
+    }
+    sql, params = queries[connection.vendor]
+    cursor = connection.cursor()
+    cursor.execute(sql, params)
+    return cursor.fetchone() is not None
+
+
+def sql_create_order_constraint(model, using=DEFAULT_DB_ALIAS):
+    """
+    Return the SQL statements creating the unique constraint on the
+    ``order_with_respect_to`` column and the ``order`` column of ``model``.
+    The constraint also serves as the composite index of the stacks.
+    """
+    connection = connections[using]
+    qn = connection.ops.quote_name
+    name = qn(order_constraint_name(model, connection))
+    table = qn(model._meta.db_table)
+    columns = ', '.join([qn(column) for column in _order_constraint_columns(model)])
+    if connection.vendor == 'postgresql':
+        deferrable = ''
+        if getattr(model, 'order_constraint_deferrable', False):
+            deferrable = ' DEFERRABLE INITIALLY IMMEDIATE'
+        return ['ALTER TABLE %s ADD CONSTRAINT %s UNIQUE (%s)%s;' % (table, name, columns, deferrable)]
+    return ['CREATE UNIQUE INDEX %s ON %s (%s);' % (name, table, columns)]
+
+
+def add_order_constraint(model, using=DEFAULT_DB_ALIAS):
+    """
+    Create the unique constraint on the ``order_with_respect_to`` column and
+    the ``order`` column of ``model``.
+    """
+    _execute(sql_create_order_constraint(model, using), using)
+
+
+def _execute(statements, using):
+    from ordered_model.models import atomic
+    with atomic(using=using, savepoint=False):
+        cursor = connections[using].cursor()
+        for sql in statements:
+            cursor.execute(sql)
+        transaction.set_dirty(using=using)
+
+
+def check_order_constraint(model, using=DEFAULT_DB_ALIAS):
+    """
+    Return a list of messages describing the objects of ``model`` that share
+    their order with another object of their stack, which a unique
+    constraint would reject.
+    """
+    attnames = model._get_order_with_respect_to_attnames()
+    duplicates = model._default_manager.using(using).order_by().values_list(
+        *(attnames + ['order'])).annotate(count=Count('pk')).filter(count__gt=1)
+    label = '%s.%s' % (model._meta.app_label, model._meta.object_name)
+    errors = []
+    for row in duplicates:
+        stack = ''
+        if attnames:
+            stack = ' of %s %s' % (', '.join(model._get_order_with_respect_to_fields()),
+                                   ', '.join([str(value) for value in row[:-2]]))
+        errors.append('%s: %d objects have order %s in the stack%s.' % (
+            label, row[-1], row[-2], stack))
+    return errors
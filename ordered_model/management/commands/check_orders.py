@@ -0,0 +1,42 @@
+from optparse import make_option
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import router
+from django.db.models import get_model, get_models
+
+from ordered_model.constraints import check_order_constraint
+from ordered_model.models import OrderedModel
+
+
+class Command(BaseCommand):
+    args = '<app_label.ModelName ...>'
+    help = ("Reports objects of ordered models sharing their order with another "
+            "object of their stack. Checks all ordered models if none are given.")
+    option_list = BaseCommand.option_list + (
+        make_option('--database', action='store', dest='database', default=None,
+                    help='Nominates a database to check. Defaults to the database '
+                         'the models are read from.'),
+    )
+
+    def handle(self, *labels, **options):
+        if labels:
+            models = []
+            for label in labels:
+                try:
+                    app_label, model_name = label.split('.')
+                except ValueError:
+                    raise CommandError("Expected app_label.ModelName, got %r." % label)
+                model = get_model(app_label, model_name)
+                if model is None or not issubclass(model, OrderedModel):
+                    raise CommandError("%s is not an ordered model." % label)
+                models.append(model)
+        else:
+            models = [model for model in get_models() if issubclass(model, OrderedModel)]
+
+        errors = []
+        for model in models:
+            errors.extend(check_order_constraint(model, options['database'] or router.db_for_read(model)))
+        for error in errors:
+            self.stdout.write("%s\n" % error)
+        if errors:
+            raise CommandError("%d duplicate orders found." % len(errors))
@@ -0,0 +1,53 @@
+import time
+from optparse import make_option
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import get_model, get_models
+
+from ordered_model.models import OrderedModel, RankedModel
+
+
+class Command(BaseCommand):
+    args = '<app_label.ModelName ...>'
+    help = ("Renumbers the orders of ordered models to close the gaps left by "
+            "deleted objects, and gives ranked models short ranks again. "
+            "Compacts all ordered models if none are given.")
+    option_list = BaseCommand.option_list + (
+        make_option('--database', action='store', dest='database', default=None,
+                    help='Nominates a database to compact. Defaults to the database '
+                         'the models are written to.'),
+        make_option('--chunk-size', action='store', dest='chunk_size', type='int',
+                    default=1000, help='Number of objects written per statement.'),
+        make_option('--fragmented', action='store_true', dest='fragmented', default=False,
+                    help='Only compact the stacks of ordered models that have gaps, '
+                         'e.g. those of models with the lazy order_delete_policy.'),
+    )
+
+    def handle(self, *labels, **options):
+        if labels:
+            models = []
+            for label in labels:
+                try:
+                    app_label, model_name = label.split('.')
+                except ValueError:
+                    raise CommandError("Expected app_label.ModelName, got %r." % label)
+                model = get_model(app_label, model_name)
+                if model is None or not issubclass(model, (OrderedModel, RankedModel)):
+                    raise CommandError("%s is not an ordered model." % label)
+                models.append(model)
+        else:
+            models = [model for model in get_models() if issubclass(model, (OrderedModel, RankedModel))]
+
+        for model in models:
+            kwargs = {}
+            if options.get('fragmented'):
+                if not issubclass(model, OrderedModel):
+                    # ranks have no gaps
+                    continue
+                kwargs['fragmented'] = True
+            start = time.time()
+            count = model.compact(using=options['database'], chunk_size=options['chunk_size'], **kwargs)
+            elapsed = time.time() - start
+            self.stdout.write("Compacted %s.%s: %d rows in %.2fs (%.0f rows/s)\n" % (
+                model._meta.app_label, model._meta.object_name, count, elapsed,
+                count / elapsed if elapsed else 0))
@@ -1,45 +1,1104 @@
+import hashlib
+import threading
+import time
 import warnings
+import zlib
+from contextlib import contextmanager
+from functools import wraps
+from django.conf import settings
 from django.contrib.contenttypes.models import ContentType
+from django.core.cache import get_cache
 from django.core.urlresolvers import reverse
-from django.db import models
-from django.db.models import Max, Min, F
+from django.db import connections, models, router, transaction
+from django.db.models import Count, Max, Min, F, Q, signals
+from django.db.models.options import DEFAULT_NAMES
+from django.db.models.query import QuerySet
+from django.utils import six
 from django.utils.translation import ugettext as _
 
+from ordered_model.constraints import add_order_index, order_constraint_name, order_index_exists
+from ordered_model.rank import RANK_WIDTH, ranks_between, spread_ranks
+from ordered_model.signals import order_changed
 
-class OrderedModel(models.Model):
+try:
+    from django.db.transaction import atomic
+except ImportError:  # Django < 1.6
+    from django.db.transaction import commit_on_success
+
+    @contextmanager
+    def atomic(using=None, savepoint=True):
+        # A nested commit_on_success commits the enclosing transaction when
+        # it exits, so join a managed transaction instead.
+        if transaction.is_managed(using=using):
+            yield
+        else:
+            with commit_on_success(using=using):
+                yield
+
+
+@contextmanager
+def _snapshot(using):
     """
-    An abstract model that allows objects to be ordered relative to each other.
-    Provides an ``order`` field.
+    Run the block in a repeatable read transaction on PostgreSQL and MySQL,
+    where InnoDB reads from a snapshot by default, unless a transaction is
+    open already. Needs Django 1.6 to know whether one is.
+    """
+    connection = connections[using]
+    if connection.vendor not in ('postgresql', 'mysql') or getattr(connection, 'in_atomic_block', True):
+        yield
+        return
+    with atomic(using=using):
+        if connection.vendor == 'postgresql':
+            connection.cursor().execute('SET TRANSACTION ISOLATION LEVEL REPEATABLE READ')
+        yield
+
+
+def _int32_hash(value):
+    """
+    Return a stable signed 32 bit hash of ``value``, e.g. for advisory locks.
+    """
+    h = zlib.crc32((u'%s' % (value,)).encode('utf-8')) & 0xffffffff
+    return h - 0x100000000 if h >= 0x80000000 else h
+
+
+def _update_orders(model, using, orders, parked=False, values=None):
+    """
+    Set the orders given as ``(pk, order)`` pairs with a single
+    ``UPDATE ... SET order = CASE pk WHEN ... END`` statement, split into
+    several only where the database limits the number of query parameters.
+    Unless they are ``parked`` already, the objects are first moved out of
+    the way of a unique constraint on the order, see ``_park_orders()``.
+    ``values`` maps attribute names to values set on all objects alongside.
+    Meant to be called inside a transaction.
+    """
+    connection = connections[using]
+    qn = connection.ops.quote_name
+    pk_field = model._meta.pk
+    order_field = model._meta.get_field('order')
+    fields = dict((f.attname, f) for f in model._meta.fields)
+    assignments = []
+    value_params = []
+    for attname, value in (values or {}).items():
+        assignments.append('%s = %%s, ' % qn(fields[attname].column))
+        value_params.append(fields[attname].get_db_prep_save(value, connection))
+    orders = list(orders)
+    batch_size = 300 if connection.vendor == 'sqlite' else len(orders)
+    if not parked:
+        _park_orders(model, using, [pk for pk, order in orders])
+    cursor = connection.cursor()
+    for i in range(0, len(orders), batch_size):
+        batch = orders[i:i + batch_size]
+        pks = [pk_field.get_db_prep_value(pk, connection) for pk, order in batch]
+        params = []
+        for pk, (_pk, order) in zip(pks, batch):
+            params.extend([pk, order_field.get_db_prep_value(order, connection)])
+        cursor.execute('UPDATE %s SET %s%s = CASE %s %s END WHERE %s IN (%s)' % (
+            qn(model._meta.db_table), ''.join(assignments), qn(order_field.column), qn(pk_field.column),
+            ' '.join(['WHEN %s THEN %s'] * len(batch)),
+            qn(pk_field.column), ', '.join(['%s'] * len(batch))
+        ), value_params + params + pks)
+    transaction.set_dirty(using=using)
+    written = getattr(_written, 'orders', None)
+    if written is not None:
+        written.update(orders)
+
+
+def _in_transaction(using):
+    """
+    Return whether a transaction is open on the database ``using``.
+    """
+    connection = connections[using]
+    if hasattr(connection, 'in_atomic_block'):
+        return connection.in_atomic_block or not connection.get_autocommit()
+    return transaction.is_managed(using=using)
+
+
+def _delete_after_commit(using, cache, cache_keys):
+    """
+    Delete ``cache_keys`` from ``cache`` again once the transaction open on
+    ``using`` commits. Django has no hook for this, so the ``commit()`` of
+    the connection is wrapped the first time.
+    """
+    connection = connections[using]
+    pending = getattr(connection, '_ordered_model_stale', None)
+    if pending is None:
+        pending = connection._ordered_model_stale = {}
+        commit = connection.commit
+
+        def commit_and_delete():
+            commit()
+            stale = list(pending.values())
+            pending.clear()
+            for cache, cache_key in stale:
+                cache.delete(cache_key)
+        connection.commit = commit_and_delete
+    for cache_key in cache_keys:
+        pending[id(cache), cache_key] = (cache, cache_key)
+
+
+def _park_orders(model, using, pks, room=0):
+    """
+    Move the objects with the primary keys ``pks`` above all orders in use,
+    leaving ``room`` orders free above those for the others to be shifted
+    into, when the orders of ``model`` are unique, so that writing their new
+    orders one row after the other doesn't collide with their old ones.
+    Returns the offset added to their orders, or None when nothing was moved.
+    """
+    offset = model._order_offset(using)
+    if offset is not None:
+        offset += room
+        batch_size = 300 if connections[using].vendor == 'sqlite' else len(pks)
+        for i in range(0, len(pks), batch_size):
+            model._base_manager.using(using).filter(
+                pk__in=pks[i:i + batch_size]).update(order=F('order') + offset)
+    return offset
+
+
+def _raw_rows(qs):
+    """
+    Return the rows of the ``values_list()`` queryset ``qs`` as the database
+    returns them, for aggregates Django 1.4 would convert to floats.
+    """
+    sql, params = qs.query.get_compiler(using=qs.db).as_sql()
+    cursor = connections[qs.db].cursor()
+    cursor.execute(sql, params)
+    return cursor.fetchall()
+
+
+class _StatementCounter(object):
+    """
+    Count the statements run on ``connection`` inside the block and the
+    rows written by them, through the debug cursor of the connection.
+    """
+
+    def __init__(self, connection):
+        self.connection = connection
+        self.statements = 0
+        self.rows_written = 0
+
+    def __enter__(self):
+        connection = self.connection
+        self._make_debug_cursor = connection.__dict__.get('make_debug_cursor')
+        self._use_debug_cursor = connection.use_debug_cursor
+        # None makes the connection log queries when DEBUG is on
+        self._logging = self._use_debug_cursor or (self._use_debug_cursor is None and settings.DEBUG)
+        self._logged = len(connection.queries)
+        make_debug_cursor = connection.make_debug_cursor
+        connection.make_debug_cursor = lambda cursor: _CountingCursor(make_debug_cursor(cursor), self)
+        connection.use_debug_cursor = True
+        return self
+
+    def __exit__(self, *exc_info):
+        connection = self.connection
+        if self._make_debug_cursor is None:
+            del connection.make_debug_cursor
+        else:
+            connection.make_debug_cursor = self._make_debug_cursor
+        if not self._logging:
+            # only keep the log if it was kept before
+            del connection.queries[self._logged:]
+        connection.use_debug_cursor = self._use_debug_cursor
+
+    def record(self, sql, rowcount):
+        self.statements += 1
+        if sql.lstrip()[:6].upper() in ('INSERT', 'UPDATE', 'DELETE'):
+            self.rows_written += max(rowcount or 0, 0)
+
+
+class _CountingCursor(object):
+
+    def __init__(self, cursor, counter):
+        self.cursor = cursor
+        self.counter = counter
+
+    def execute(self, sql, params=()):
+        try:
+            return self.cursor.execute(sql, params)
+        finally:
+            self.counter.record(sql, self.cursor.rowcount)
+
+    def executemany(self, sql, param_list):
+        try:
+            return self.cursor.executemany(sql, param_list)
+        finally:
+            self.counter.record(sql, self.cursor.rowcount)
+
+    def __getattr__(self, attr):
+        return getattr(self.cursor, attr)
+
+    def __iter__(self):
+        return iter(self.cursor)
+
+
+_instrumentation = threading.local()
+_written = threading.local()
+
+
+@contextmanager
+def _record_orders():
+    """
+    Collect the orders that ``_update_orders()`` and ``_shift_orders()``
+    write in the block in the yielded dict, by primary key.
+    """
+    orders = _written.orders = {}
+    try:
+        yield orders
+    finally:
+        _written.orders = None
+
+
+def _instrumented(operation):
+    """
+    Send ``order_changed`` after the decorated ordering operation, measuring
+    it only while a receiver is connected. Operations run by another one,
+    e.g. ``to()`` by ``top()``, are part of the outer one.
+    """
+    def decorator(method):
+        @wraps(method)
+        def wrapper(self, *args, **kwargs):
+            if (not order_changed.receivers or getattr(_instrumentation, 'active', False) or
+                    (operation == 'insert' and self.pk)):
+                return method(self, *args, **kwargs)
+            using = kwargs.get('using') or self._state.db or router.db_for_write(self.__class__, instance=self)
+            group = self._get_ordering_key()
+            old_order = None if operation == 'insert' else self.order
+            _instrumentation.active = True
+            try:
+                with _StatementCounter(connections[using]) as counter:
+                    start = time.time()
+                    result = method(self, *args, **kwargs)
+                    elapsed = time.time() - start
+            finally:
+                _instrumentation.active = False
+            order_changed.send(
+                sender=self.__class__, instance=self, operation=operation, group=group,
+                old_order=old_order, new_order=None if operation == 'delete' else self.order,
+                rows_written=counter.rows_written, statements=counter.statements,
+                elapsed=elapsed, using=using)
+            return result
+        return wrapper
+    return decorator
+
+
+class OrderedModelQuerySet(QuerySet):
+
+    def bulk_create(self, objs, batch_size=None):
+        """
+        Insert the given objects like ``QuerySet.bulk_create`` does, assigning
+        an ``order`` to every object that has none yet.
+
+        New objects are appended to the end of their ordering group in the
+        sequence they are passed in. The current maximum of all affected
+        groups is fetched with a single grouped query. With ``order_lock``
+        the groups are locked first, in the order of their keys so that
+        concurrent imports don't deadlock.
+        """
+        objs = list(objs)
+        new = [obj for obj in objs if obj.order in (None, '')]
+        with atomic(using=self.db, savepoint=False):
+            if new and self.model.order_lock:
+                groups = dict((obj._get_ordering_key(), obj) for obj in new)
+                for key in sorted(groups):
+                    groups[key].lock_ordering_group(self.db)
+            if new:
+                self._assign_orders(new)
+            if batch_size:
+                for i in range(0, len(objs), batch_size):
+                    super(OrderedModelQuerySet, self).bulk_create(objs[i:i + batch_size])
+            else:
+                super(OrderedModelQuerySet, self).bulk_create(objs)
+        self.model._clear_order_cache(self.db, set(obj._get_ordering_key() for obj in objs))
+        return objs
+
+    def create_at(self, position, **kwargs):
+        """
+        Create an object like ``create()`` does, at ``position`` in its stack,
+        counting from 0, instead of at its bottom. The objects from that
+        position on are shifted down with one statement, in the same
+        transaction.
+        """
+        obj = self.model(**kwargs)
+        # read by _assign_next_order()
+        obj._insert_position = position
+        with atomic(using=self.db, savepoint=False):
+            obj.save(force_insert=True, using=self.db)
+        return obj
+
+    def bulk_create_at(self, position, objs, batch_size=None):
+        """
+        Insert the given objects of one stack like ``bulk_create()`` does, in
+        the sequence they are passed in, at ``position`` in that stack,
+        counting from 0. A gap of their number is opened there with one
+        statement, in the same transaction, and filled with their orders.
+        """
+        objs = list(objs)
+        if not objs:
+            return objs
+        if len(set(obj._get_ordering_key() for obj in objs)) > 1:
+            raise ValueError("%s objects to insert must belong to the same %s." % (
+                self.model._meta.object_name, ', '.join(self.model._get_order_with_respect_to_fields())))
+        with atomic(using=self.db, savepoint=False):
+            if objs[0].order_lock:
+                objs[0].lock_ordering_group(self.db)
+            for obj, order in zip(objs, self._open_gap(objs[0], position, len(objs))):
+                obj.order = order
+            return self.bulk_create(objs, batch_size)
+
+    def _open_gap(self, obj, position, count):
+        """
+        Return ``count`` free orders at ``position`` in the stack of ``obj``,
+        shifting the objects from there on if there is no room. Past the
+        last object these are the orders following it.
+        """
+        if position < 0:
+            raise ValueError("Positions start at 0, got %r." % position)
+        model = self.model
+        stack = model._default_manager.using(self.db).filter(
+            **dict(zip(model._get_order_with_respect_to_attnames(), obj._get_ordering_key())))
+        # the orders of the objects at position - 1 and position
+        orders = list(stack.order_by('order', 'pk').values_list(
+            'order', flat=True)[max(position - 1, 0):position + 1])
+        if position == 0:
+            orders.insert(0, None)
+        if len(orders) == 2:
+            lower, upper = orders
+        else:
+            lower, upper = orders[0] if orders else model._max_order(stack), None
+        return model._block_orders(stack, lower, upper, count)
+
+    def reorder(self, ids, within=None):
+        """
+        Put the objects with the primary keys ``ids`` into this order.
+
+        All objects must belong to the same stack, the one of the
+        ``order_with_respect_to`` value ``within`` if given. They swap the
+        order values they use among themselves, so the positions of other
+        objects are kept. Only objects whose order changes are written, with
+        a single statement. Returns a dict mapping their primary keys to their
+        new orders.
+        """
+        pk_field = self.model._meta.pk
+        ids = [pk_field.to_python(pk) for pk in ids]
+        if len(set(ids)) != len(ids):
+            raise ValueError("Objects to reorder must be given only once.")
+        order_with_respect_to = self.model.order_with_respect_to
+        fields = ['pk', 'order'] + self.model._get_order_with_respect_to_attnames()
+        if order_with_respect_to and within is not None:
+            within = self.model._get_order_with_respect_to_key(within)
+        rows = self.model._default_manager.using(self.db).filter(pk__in=ids).values_list(*fields)
+        current = {}
+        groups = set()
+        for row in rows:
+            current[row[0]] = row[1]
+            groups.add(row[2:])
+        missing = [pk for pk in ids if pk not in current]
+        if missing:
+            raise ValueError("%s with primary keys %r do not exist." % (
+                self.model._meta.object_name, missing))
+        if len(groups) > 1 or (order_with_respect_to and within is not None and
+                               groups and groups != set([within])):
+            raise ValueError("%s objects to reorder must belong to the same %s." % (
+                self.model._meta.object_name, ', '.join(self.model._get_order_with_respect_to_fields())))
+        changed = {}
+        for pk, order in zip(ids, sorted(current.values())):
+            if current[pk] != order:
+                changed[pk] = order
+        if changed:
+            with atomic(using=self.db, savepoint=False):
+                _update_orders(self.model, self.db, changed.items())
+            self.model._clear_order_cache(self.db, groups)
+        return changed
+
+    def move_to_group(self, value, position=None):
+        """
+        Move the objects of this queryset to the stack of the
+        ``order_with_respect_to`` value ``value``, keeping their order, at
+        ``position`` in that stack, counting from 0, or to its bottom.
+
+        The objects are appended to the new stack with one statement, then
+        the gaps they leave in their old stacks are closed with one statement
+        per stack unless orders are sparse, and the block is moved to
+        ``position`` like ``move_above()`` does, all in one transaction.
+        """
+        model = self.model
+        if not model.order_with_respect_to:
+            raise ValueError("%s has no order_with_respect_to." % model._meta.object_name)
+        if position is not None and position < 0:
+            raise ValueError("Positions start at 0, got %r." % position)
+        attnames = model._get_order_with_respect_to_attnames()
+        key = model._get_order_with_respect_to_key(value)
+        rows = list(self.order_by(*self._keyset_ordering()).values_list('pk', 'order', *attnames))
+        if not rows:
+            return
+        pks = [row[0] for row in rows]
+        left = {}
+        for row in rows:
+            left.setdefault(row[2:], []).append(row[1])
+        stack = model._default_manager.using(self.db).filter(**dict(zip(attnames, key)))
+        with atomic(using=self.db, savepoint=False):
+            # Orders past the bottom of the new stack, including the objects
+            # already in it, collide with nothing. Closing the gaps of the
+            # old stacks then also moves the objects up to the new bottom.
+            orders = model._next_orders(model._max_order(stack), len(pks))
+            _update_orders(model, self.db, zip(pks, orders), parked=True, values=dict(zip(attnames, key)))
+            if getattr(model, 'order_step', None) == 1:
+                for old_key, old_orders in left.items():
+                    model._shift_after_deleted(self.db, old_key, old_orders)
+            if position is not None:
+                refs = list(stack.exclude(pk__in=pks).order_by('order', 'pk')[position:position + 1])
+                if refs:
+                    model._default_manager.using(self.db).filter(pk__in=pks).move_above(refs[0])
+        model._clear_order_cache(self.db, list(left) + [key])
+
+    def move_above(self, ref):
+        """
+        Move the objects of this queryset directly above the referenced
+        object, keeping their order, with a constant number of queries.
+        """
+        return self._move_block('above', ref)
+
+    def move_below(self, ref):
+        """
+        Move the objects of this queryset directly below the referenced
+        object, keeping their order, with a constant number of queries.
+        """
+        return self._move_block('below', ref)
+
+    def to_top(self):
+        """
+        Move the objects of this queryset to the top of their stack, keeping
+        their order, with a constant number of queries.
+        """
+        return self._move_block('top')
+
+    def to_bottom(self):
+        """
+        Move the objects of this queryset to the bottom of their stack,
+        keeping their order, with a constant number of queries.
+        """
+        return self._move_block('bottom')
+
+    def after(self, obj):
+        """
+        Return the objects of this queryset that come after ``obj``, an
+        object or its primary key, ordered by their stack, order and primary
+        key. The position of ``obj`` is the cursor of keyset pagination:
+        ``after(last)[:n]`` reads the next ``n`` objects from the index, no
+        matter how far down the list ``last`` is.
+        """
+        return self._keyset(obj, reverse=False)
+
+    def before(self, obj):
+        """
+        Return the objects of this queryset that come before ``obj``, an
+        object or its primary key, closest first. ``before(first)[:n]``
+        reads the ``n`` objects preceding ``first`` in reverse order.
+        """
+        return self._keyset(obj, reverse=True)
+
+    def _keyset(self, obj, reverse):
+        fields = self._keyset_fields()
+        if isinstance(obj, models.Model):
+            values = [getattr(obj, field) for field in fields]
+        else:
+            values = self.model._default_manager.using(self.db).values_list(*fields).get(pk=obj)
+        return self.filter(self._keyset_condition(values, reverse)).order_by(*self._keyset_ordering(reverse))
+
+    def _keyset_fields(self):
+        return self.model._get_order_with_respect_to_attnames() + ['order', self.model._meta.pk.attname]
+
+    def _keyset_condition(self, values, reverse=False):
+        # (a, b, c) > (x, y, z) as a > x OR (a = x AND b > y) OR ...
+        fields = self._keyset_fields()
+        lookup = 'lt' if reverse else 'gt'
+        condition = Q()
+        for i in range(len(fields)):
+            term = Q(**{'%s__%s' % (fields[i], lookup): values[i]})
+            for field, value in zip(fields[:i], values[:i]):
+                term &= Q(**{field: value})
+            condition |= term
+        return condition
+
+    def iter_ordered(self, group=None, chunk_size=2000, values=None):
+        """
+        Iterate over the objects of this queryset in stack order, reading
+        ``chunk_size`` of them per query, each chunk continuing after the
+        last object of the previous one. ``group`` restricts the iteration
+        to the stack of that ``order_with_respect_to`` value. Yields
+        instances, or dicts like ``values()`` does if ``values`` lists the
+        names of the fields to read.
+
+        On PostgreSQL and MySQL the chunks are read in one repeatable read
+        transaction, unless the iteration starts inside a transaction
+        already, so that objects moved meanwhile are neither skipped nor
+        read twice. Finish or ``close()`` the iterator to end it.
+        """
+        model = self.model
+        qs = self
+        if model.order_with_respect_to and group is not None:
+            key = model._get_order_with_respect_to_key(group)
+            qs = qs.filter(**dict(zip(model._get_order_with_respect_to_attnames(), key)))
+        qs = qs.order_by(*self._keyset_ordering())
+        fields = self._keyset_fields()
+        extra = []
+        if values is not None:
+            values = list(values)
+            extra = [field for field in fields if field not in values]
+            qs = qs.values(*(values + extra))
+        with _snapshot(self.db):
+            cursor = None
+            while True:
+                chunk = qs
+                if cursor is not None:
+                    chunk = chunk.filter(self._keyset_condition(cursor))
+                rows = list(chunk[:chunk_size])
+                if not rows:
+                    return
+                if values is None:
+                    cursor = [getattr(rows[-1], field) for field in fields]
+                else:
+                    cursor = [rows[-1][field] for field in fields]
+                for row in rows:
+                    for field in extra:
+                        del row[field]
+                    yield row
+                if len(rows) < chunk_size:
+                    return
+
+    def _keyset_ordering(self, reverse=False):
+        # attnames like question_id can't be ordered by before Django 1.7
+        ordering = []
+        for name in self.model._get_order_with_respect_to_fields():
+            field = self.model._meta.get_field(name)
+            ordering.append('%s__pk' % name if field.rel else name)
+        ordering.extend(['order', 'pk'])
+        if reverse:
+            ordering = ['-%s' % name for name in ordering]
+        return ordering
+
+    def _move_block(self, where, ref=None):
+        model = self.model
+        attnames = model._get_order_with_respect_to_attnames()
+        rows = list(self.order_by('order', 'pk').values_list('pk', 'order', *attnames))
+        if not rows:
+            return {}
+        groups = set(row[2:] for row in rows)
+        if ref is not None:
+            groups.add(tuple(getattr(ref, attname) for attname in attnames))
+        if len(groups) > 1:
+            raise ValueError("%s objects to move must belong to the same %s." % (
+                model._meta.object_name, ', '.join(model._get_order_with_respect_to_fields())))
+        pks = [row[0] for row in rows]
+        key = groups.pop()
+        others = model._default_manager.using(self.db).filter(
+            **dict(zip(attnames, key))).exclude(pk__in=pks)
+        lower = upper = None
+        if where == 'above':
+            lower = model._max_order(others.filter(order__lt=ref.order))
+            upper = ref.order
+        elif where == 'below':
+            lower = ref.order
+            upper = model._min_order(others.filter(order__gt=ref.order))
+        elif where == 'top':
+            upper = model._min_order(others)
+        else:
+            lower = model._max_order(others)
+        with atomic(using=self.db, savepoint=False):
+            # out of the way of the others too, should they be shifted down
+            parked = _park_orders(model, self.db, pks, len(rows) * getattr(model, 'order_step', 1)) is not None
+            orders = model._block_orders(others, lower, upper, len(rows))
+            changed = {}
+            for row, order in zip(rows, orders):
+                if row[1] != order:
+                    changed[row[0]] = order
+            if parked:
+                _update_orders(model, self.db, zip(pks, orders), parked=True)
+            elif changed:
+                _update_orders(model, self.db, changed.items())
+        model._clear_order_cache(self.db, [key])
+        return changed
+
+    def delete(self):
+        """
+        Delete the objects like ``QuerySet.delete`` does, then close the gaps
+        in their stacks according to the ``order_delete_policy`` of the
+        model, with one statement per stack.
+        """
+        policy = getattr(self.model, 'order_delete_policy', 'leave')
+        if policy != 'eager' and self.model._get_order_cache() is None:
+            return super(OrderedModelQuerySet, self).delete()
+        attnames = self.model._get_order_with_respect_to_attnames()
+        deleted = {}
+        for row in self.order_by().values_list('order', *attnames):
+            deleted.setdefault(row[1:], []).append(row[0])
+        with atomic(using=self.db, savepoint=False):
+            super(OrderedModelQuerySet, self).delete()
+            if policy == 'eager':
+                for key, orders in deleted.items():
+                    self.model._close_gaps(self.db, key, orders)
+        self.model._clear_order_cache(self.db, deleted)
+    delete.alters_data = True
+
+    def _assign_orders(self, objs):
+        qs = self.model._default_manager.using(self.db).order_by()
+        attnames = self.model._get_order_with_respect_to_attnames()
+        if attnames:
+            groups = {}
+            for obj in objs:
+                groups.setdefault(obj._get_ordering_key(), []).append(obj)
+            for i, attname in enumerate(attnames):
+                qs = qs.filter(**{'%s__in' % attname: list(set(key[i] for key in groups))})
+            maxima = dict(
+                (row[:-1], row[-1]) for row in _raw_rows(qs.values_list(*attnames).annotate(Max('order')))
+            )
+        else:
+            groups = {(): objs}
+            maxima = {(): self.model._max_order(qs)}
+        for value, group in groups.items():
+            orders = self.model._next_orders(maxima.get(value), len(group))
+            for obj, order in zip(group, orders):
+                obj.order = order
+
+
+class OrderedModelManager(models.Manager):
+
+    def get_queryset(self):
+        return OrderedModelQuerySet(self.model, using=self._db)
+    get_query_set = get_queryset  # Django < 1.6
+
+    def bulk_create(self, objs, batch_size=None):
+        return self.get_queryset().bulk_create(objs, batch_size)
+
+    def create_at(self, position, **kwargs):
+        return self.all().create_at(position, **kwargs)
+
+    def bulk_create_at(self, position, objs, batch_size=None):
+        return self.all().bulk_create_at(position, objs, batch_size)
+
+    def reorder(self, ids, within=None):
+        return self.get_queryset().reorder(ids, within)
+
+    def move_above(self, ref):
+        return self.get_queryset().move_above(ref)
+
+    def move_below(self, ref):
+        return self.get_queryset().move_below(ref)
+
+    def to_top(self):
+        return self.get_queryset().to_top()
+
+    def to_bottom(self):
+        return self.get_queryset().to_bottom()
+
+    def move_to_group(self, value, position=None):
+        return self.all().move_to_group(value, position)
+
+    def after(self, obj):
+        return self.all().after(obj)
+
+    def before(self, obj):
+        return self.all().before(obj)
+
+    def iter_ordered(self, group=None, chunk_size=2000, values=None):
+        return self.all().iter_ordered(group, chunk_size, values)
+
+
+class OrderedModelBase(models.Model):
+    """
+    The ordering logic shared by ``OrderedModel`` and ``RankedModel``, which
+    doesn't depend on the type of the ``order`` field.
     """
 
-    order = models.PositiveIntegerField(editable=False, db_index=True)
     order_with_respect_to = None
+    order_lock = False
+    order_cache = None
+
+    objects = OrderedModelManager()
 
     class Meta:
         abstract = True
-        ordering = ('order',)
 
     def _get_order_with_respect_to(self):
-        return getattr(self, self.order_with_respect_to)
+        if isinstance(self.order_with_respect_to, six.string_types):
+            return getattr(self, self.order_with_respect_to)
+        return tuple(getattr(self, name) for name in self.order_with_respect_to)
+
+    @classmethod
+    def _get_order_with_respect_to_fields(cls):
+        """
+        Return the names of the fields given as ``order_with_respect_to``,
+        which is the name of one field or a tuple of several.
+        """
+        if not cls.order_with_respect_to:
+            return []
+        if isinstance(cls.order_with_respect_to, six.string_types):
+            return [cls.order_with_respect_to]
+        return list(cls.order_with_respect_to)
+
+    @classmethod
+    def _get_order_with_respect_to_attnames(cls):
+        """
+        Return the attribute names holding the raw column values of the
+        ``order_with_respect_to`` fields, e.g. ``question_id``.
+        """
+        # cached per model class, looked up by every move
+        attnames = cls.__dict__.get('_order_with_respect_to_attnames')
+        if attnames is None:
+            attnames = [cls._meta.get_field(name).attname for name in cls._get_order_with_respect_to_fields()]
+            cls._order_with_respect_to_attnames = attnames
+        return list(attnames)
+
+    def _get_ordering_key(self):
+        return tuple(getattr(self, attname) for attname in self._get_order_with_respect_to_attnames())
+
+    @classmethod
+    def _get_order_with_respect_to_key(cls, value):
+        """
+        Return the column values identifying the stack of the given
+        ``order_with_respect_to`` value, an object or its primary key, or a
+        tuple of them when ``order_with_respect_to`` names several fields.
+        """
+        names = cls._get_order_with_respect_to_fields()
+        if isinstance(cls.order_with_respect_to, six.string_types):
+            value = (value,)
+        key = []
+        for name, part in zip(names, value):
+            field = cls._meta.get_field(name)
+            target = field.rel.get_related_field() if field.rel else field
+            if isinstance(part, models.Model):
+                part = getattr(part, target.attname)
+            key.append(target.to_python(part))
+        return tuple(key)
+
+    @classmethod
+    def _get_order_cache(cls):
+        """
+        Return the cache configured as ``order_cache``, a Django cache alias
+        or an object with the ``get``/``set``/``delete`` methods of one.
+        """
+        if isinstance(cls.order_cache, six.string_types):
+            return get_cache(cls.order_cache)
+        return cls.order_cache
+
+    @classmethod
+    def _order_cache_key(cls, using, key):
+        digest = hashlib.md5(u','.join([u'%s' % (value,) for value in key]).encode('utf-8'))
+        return 'ordered_model:%s:%s:%s' % (cls._meta.db_table, using, digest.hexdigest())
+
+    @classmethod
+    def _clear_order_cache(cls, using, keys):
+        """
+        Drop the cached positional index of the stacks ``keys``. Inside a
+        transaction they are dropped again when it commits, as lookups from
+        other connections may cache the stacks as they were until then.
+        """
+        cache = cls._get_order_cache()
+        if cache is not None:
+            cache_keys = [cls._order_cache_key(using, key) for key in keys]
+            for cache_key in cache_keys:
+                cache.delete(cache_key)
+            if _in_transaction(using):
+                _delete_after_commit(using, cache, cache_keys)
+
+    def _get_stack_pks(self):
+        """
+        Return the primary keys of the objects in the stack of this object,
+        in order, from ``order_cache`` if it holds them.
+        """
+        using = self._state.db or router.db_for_read(self.__class__, instance=self)
+        cache = self._get_order_cache()
+        cache_key = self._order_cache_key(using, self._get_ordering_key())
+        pks = cache.get(cache_key)
+        if pks is None or self.pk not in pks:
+            pks = list(self.get_ordering_queryset().using(using).order_by(
+                'order', 'pk').values_list('pk', flat=True))
+            cache.set(cache_key, pks)
+        return pks
+
+    def get_position(self):
+        """
+        Return the position of this object in its stack, counting from 0.
+        """
+        if self._get_order_cache() is not None:
+            return self._get_stack_pks().index(self.pk)
+        return self.get_ordering_queryset().filter(order__lt=self.order).count()
+
+    def get_next(self):
+        """
+        Return the object after this one in its stack, or None if it is the
+        last one.
+        """
+        if self._get_order_cache() is not None:
+            pks = self._get_stack_pks()
+            position = pks.index(self.pk)
+            if position + 1 == len(pks):
+                return None
+            return self._default_manager.using(self._state.db).get(pk=pks[position + 1])
+        neighbours = self.get_ordering_queryset().filter(order__gt=self.order).order_by('order')[:1]
+        return neighbours[0] if neighbours else None
+
+    def get_previous(self):
+        """
+        Return the object before this one in its stack, or None if it is the
+        first one.
+        """
+        if self._get_order_cache() is not None:
+            pks = self._get_stack_pks()
+            position = pks.index(self.pk)
+            if position == 0:
+                return None
+            return self._default_manager.using(self._state.db).get(pk=pks[position - 1])
+        neighbours = self.get_ordering_queryset().filter(order__lt=self.order).order_by('-order')[:1]
+        return neighbours[0] if neighbours else None
+
+    def count_in_group(self):
+        """
+        Return the number of objects in the stack of this object.
+        """
+        if self._get_order_cache() is not None:
+            return len(self._get_stack_pks())
+        return self.get_ordering_queryset().count()
+
+    def _to_position(self, position):
+        """
+        Move this object to ``position`` in its stack, counting from 0, above
+        the object found there now or to the bottom past the last one.
+        Returns the new orders of the objects the move wrote, this one
+        included, by primary key.
+        """
+        if position < 0:
+            raise ValueError("Positions start at 0, got %r." % position)
+        others = self.get_ordering_queryset().exclude(pk=self.pk).order_by('order', 'pk')
+        refs = list(others[position:position + 1])
+        old_order = self.order
+        with _record_orders() as orders:
+            if refs:
+                self.above(refs[0])
+            else:
+                self.bottom()
+        if self.order != old_order:
+            orders[self.pk] = self.order
+        return orders
+
+    def move_to_group(self, value, position=None):
+        """
+        Move this object to the stack of the ``order_with_respect_to`` value
+        ``value``, an object or its primary key, or a tuple of them when
+        ``order_with_respect_to`` names several fields. It is put at
+        ``position`` in that stack, counting from 0, or at its bottom. The
+        gap it leaves in its old stack is closed, in one transaction.
+        """
+        cls = self.__class__
+        if not cls.order_with_respect_to:
+            raise ValueError("%s has no order_with_respect_to." % cls._meta.object_name)
+        if position is not None and position < 0:
+            raise ValueError("Positions start at 0, got %r." % position)
+        key = cls._get_order_with_respect_to_key(value)
+        old_key = self._get_ordering_key()
+        if key == old_key:
+            if position is not None:
+                self._to_position(position)
+            return
+        using = router.db_for_write(cls, instance=self)
+        with atomic(using=using, savepoint=False):
+            self._leave_stack(using)
+            for attname, part in zip(self._get_order_with_respect_to_attnames(), key):
+                setattr(self, attname, part)
+            self._enter_stack(using, position)
+        cls._clear_order_cache(using, [old_key, key])
+
+    def _leave_stack(self, using):
+        """
+        Close the gap this object leaves in its stack when it moves to
+        another one. Gaps are fine between ranks.
+        """
+
+    def _enter_stack(self, using, position):
+        """
+        Write the new ``order_with_respect_to`` values of this object along
+        with an order at ``position`` in its new stack, or None for the
+        bottom.
+        """
+        self.order = self._next_orders(self._max_order(self.get_ordering_queryset().using(using)), 1)[0]
+        self._save_group(using)
+        if position is not None:
+            self._to_position(position)
+
+    def _save_group(self, using):
+        """
+        Write the ``order_with_respect_to`` fields and the order of this
+        object with one UPDATE, sending ``pre_save`` and ``post_save`` with
+        ``update_fields`` set to just these fields.
+        """
+        cls = self.__class__
+        names = cls._get_order_with_respect_to_fields()
+        values = dict((name, getattr(self, attname))
+                      for name, attname in zip(names, self._get_order_with_respect_to_attnames()))
+        update_fields = frozenset(names + ['order'])
+        signals.pre_save.send(sender=cls, instance=self, raw=False, using=using,
+                              update_fields=update_fields)
+        cls._base_manager.using(using).filter(pk=self.pk).update(order=self.order, **values)
+        signals.post_save.send(sender=cls, instance=self, created=False, raw=False,
+                               using=using, update_fields=update_fields)
 
     def _valid_ordering_reference(self, reference):
-        return self.order_with_respect_to is None or (
-            self._get_order_with_respect_to() == reference._get_order_with_respect_to()
-        )
+        return self._get_ordering_key() == reference._get_ordering_key()
+
+    def _check_ordering_reference(self, reference, action):
+        if not self._valid_ordering_reference(reference):
+            key = self._get_ordering_key()
+            raise ValueError(
+                "%r can only be %s instances of %r which %s equals %r." % (
+                    self, action, self.__class__,
+                    ', '.join(self._get_order_with_respect_to_attnames()),
+                    key[0] if len(key) == 1 else key
+                )
+            )
 
     def get_ordering_queryset(self, qs=None):
         qs = qs or self._default_manager.all()
-        order_with_respect_to = self.order_with_respect_to
-        if order_with_respect_to:
-            value = self._get_order_with_respect_to()
-            qs = qs.filter((order_with_respect_to, value))
+        if self.order_with_respect_to:
+            qs = qs.filter(**dict(zip(self._get_order_with_respect_to_attnames(), self._get_ordering_key())))
         return qs
 
+    @_instrumented('insert')
     def save(self, *args, **kwargs):
-        if not self.id:
-            c = self.get_ordering_queryset().aggregate(Max('order')).get('order__max')
-            self.order = 0 if c is None else c + 1
-        super(OrderedModel, self).save(*args, **kwargs)
+        if not self.id and self.order_lock:
+            using = kwargs.get('using') or router.db_for_write(self.__class__, instance=self)
+            with atomic(using=using, savepoint=False):
+                self.lock_ordering_group(using)
+                self._assign_next_order(using)
+                super(OrderedModelBase, self).save(*args, **kwargs)
+        else:
+            if not self.id:
+                self._assign_next_order(kwargs.get('using'))
+            super(OrderedModelBase, self).save(*args, **kwargs)
+        self._clear_order_cache(self._state.db, [self._get_ordering_key()])
+
+    @_instrumented('delete')
+    def delete(self, *args, **kwargs):
+        using = kwargs.get('using') or router.db_for_write(self.__class__, instance=self)
+        key = self._get_ordering_key()
+        super(OrderedModelBase, self).delete(*args, **kwargs)
+        self._clear_order_cache(using, [key])
+
+    def _assign_next_order(self, using=None):
+        position = self.__dict__.pop('_insert_position', None)
+        if position is not None:
+            # created by create_at()
+            using = using or router.db_for_write(self.__class__, instance=self)
+            self.order = self._default_manager.using(using)._open_gap(self, position, 1)[0]
+            return
+        qs = self.get_ordering_queryset()
+        if using:
+            qs = qs.using(using)
+        self.order = self._next_orders(self._max_order(qs), 1)[0]
+
+    @classmethod
+    def _order_is_unique(cls):
+        """
+        Return whether the database rejects two objects with the same order
+        in a stack.
+        """
+        if cls._meta.get_field('order').unique or getattr(cls, 'order_constraint_deferrable', False):
+            return True
+        fields = set(cls._get_order_with_respect_to_fields() + ['order'])
+        return any(set(unique) == fields for unique in cls._meta.unique_together)
+
+    @classmethod
+    def _order_offset(cls, using):
+        """
+        Return an offset to move objects above all orders in use by, before
+        writing orders that would collide with a unique constraint otherwise.
+        Returns None if there is no such constraint to work around.
+        """
+        return None
+
+    @staticmethod
+    def _max_order(qs):
+        return qs.aggregate(Max('order')).get('order__max')
+
+    @staticmethod
+    def _min_order(qs):
+        return qs.aggregate(Min('order')).get('order__min')
+
+    @classmethod
+    def _next_orders(cls, last, count):
+        """
+        Return the orders for ``count`` new objects following the order
+        ``last`` (``None`` for an empty stack).
+        """
+        raise NotImplementedError
+
+    @classmethod
+    def _block_orders(cls, others, lower, upper, count):
+        """
+        Return ``count`` ascending orders between the orders ``lower`` and
+        ``upper`` (``None`` meaning no bound) for objects moved as a block.
+        If there is no room, the objects in the queryset ``others`` from
+        ``upper`` on are shifted down to open a gap.
+        """
+        raise NotImplementedError
+
+    def lock_ordering_group(self, using):
+        """
+        Keep other transactions from assigning orders in the ordering group of
+        this object until the current transaction ends.
+
+        Called by ``save()`` for new objects when ``order_lock`` is enabled.
+        PostgreSQL takes an advisory lock per group, other backends lock the
+        row referenced by ``order_with_respect_to`` (or the rows of the group
+        when it is not a foreign key) with ``SELECT ... FOR UPDATE``. SQLite
+        has no row locks, there the write lock on the database is taken up
+        front instead. Override this method to plug in another strategy.
+        """
+        connection = connections[using]
+        field = value = None
+        names = self._get_order_with_respect_to_fields()
+        if len(names) == 1:
+            field = self._meta.get_field(names[0])
+            value = getattr(self, field.attname)
+        if connection.vendor == 'postgresql':
+            key = self._get_ordering_key()
+            connection.cursor().execute('SELECT pg_advisory_xact_lock(%s, %s)', [
+                _int32_hash(self._meta.db_table), _int32_hash(key[0] if len(key) == 1 else key or None)
+            ])
+        elif connection.vendor == 'sqlite':
+            # A write statement, even one that matches no rows, makes SQLite
+            # begin the transaction and acquire the RESERVED lock.
+            column = connection.ops.quote_name(self._meta.get_field('order').column)
+            connection.cursor().execute('UPDATE %s SET %s = %s WHERE 1 = 0' % (
+                connection.ops.quote_name(self._meta.db_table), column, column
+            ))
+        elif field is not None and field.rel:
+            qs = field.rel.to._base_manager.using(using).filter(**{field.rel.field_name: value})
+            list(qs.select_for_update().values_list('pk'))
+        else:
+            list(self.get_ordering_queryset().using(using).select_for_update().values_list('pk'))
+
+    def _save_order(self, using=None, others=()):
+        """
+        Write the order of this object, and of the objects ``others`` of the
+        same model, with a single UPDATE of the order column. ``pre_save``
+        and ``post_save`` are sent with ``update_fields`` set to just the
+        order field.
+        """
+        cls = self.__class__
+        using = using or router.db_for_write(cls, instance=self)
+        objs = [self] + list(others)
+        update_fields = frozenset(['order'])
+        for obj in objs:
+            signals.pre_save.send(sender=cls, instance=obj, raw=False, using=using,
+                                  update_fields=update_fields)
+        if others:
+            with atomic(using=using, savepoint=False):
+                _update_orders(cls, using, [(obj.pk, obj.order) for obj in objs])
+        else:
+            cls._base_manager.using(using).filter(pk=self.pk).update(order=self.order)
+        cls._clear_order_cache(using, [self._get_ordering_key()])
+        for obj in objs:
+            signals.post_save.send(sender=cls, instance=obj, created=False, raw=False,
+                                   using=using, update_fields=update_fields)
 
     def _move(self, up, qs=None):
         qs = self.get_ordering_queryset(qs)
@@ -54,8 +1113,7 @@ class OrderedModel(models.Model):
             # already first/last
             return
         self.order, replacement.order = replacement.order, self.order
-        self.save()
-        replacement.save()
+        self._save_order(others=[replacement])
 
     def move(self, direction, qs=None):
         warnings.warn(
@@ -87,6 +1145,7 @@ class OrderedModel(models.Model):
         )
         return self.up()
 
+    @_instrumented('swap')
     def swap(self, qs):
         """
         Swap the positions of this object with a reference object.
@@ -96,16 +1155,9 @@ class OrderedModel(models.Model):
         except IndexError:
             # already first/last
             return
-        if not self._valid_ordering_reference(replacement):
-            raise ValueError(
-                "%r can only be swapped with instances of %r which %s equals %r." % (
-                    self, self.__class__, self.order_with_respect_to,
-                    self._get_order_with_respect_to()
-                )
-            )
+        self._check_ordering_reference(replacement, 'swapped with')
         self.order, replacement.order = replacement.order, self.order
-        self.save()
-        replacement.save()
+        self._save_order(others=[replacement])
 
     def up(self):
         """
@@ -119,6 +1171,134 @@ class OrderedModel(models.Model):
         """
         self.swap(self.get_ordering_queryset().filter(order__gt=self.order))
 
+
+class OrderedModel(OrderedModelBase):
+    """
+    An abstract model that allows objects to be ordered relative to each other.
+    Provides an ``order`` field.
+    """
+
+    order = models.PositiveIntegerField(editable=False, db_index=True)
+    order_step = 1
+    order_delete_policy = 'leave'
+    order_constraint_deferrable = False
+
+    class Meta:
+        abstract = True
+        ordering = ('order',)
+
+    @classmethod
+    def _next_orders(cls, last, count):
+        start = 0 if last is None else last + cls.order_step
+        return list(range(start, start + count * cls.order_step, cls.order_step))
+
+    @_instrumented('delete')
+    def delete(self, *args, **kwargs):
+        if self.order_delete_policy != 'eager':
+            return super(OrderedModel, self).delete(*args, **kwargs)
+        using = kwargs.get('using') or router.db_for_write(self.__class__, instance=self)
+        with atomic(using=using, savepoint=False):
+            super(OrderedModel, self).delete(*args, **kwargs)
+            self._close_gaps(using, self._get_ordering_key(), [self.order])
+        self._clear_order_cache(using, [self._get_ordering_key()])
+
+    @classmethod
+    def _order_offset(cls, using):
+        if not cls._order_is_unique():
+            return None
+        connection = connections[using]
+        if cls.order_constraint_deferrable and connection.vendor == 'postgresql':
+            connection.cursor().execute('SET CONSTRAINTS %s DEFERRED' % (
+                connection.ops.quote_name(order_constraint_name(cls, connection)),))
+            return None
+        return (cls._base_manager.using(using).aggregate(Max('order')).get('order__max') or 0) + 1
+
+    @classmethod
+    def _shift_orders(cls, qs, delta, obj=None):
+        """
+        Add ``delta`` to the orders of the objects in ``qs``. ``obj``, whose
+        new order the caller writes afterwards, is moved out of their way
+        when the orders are unique.
+        """
+        written = getattr(_written, 'orders', None)
+        if written is not None:
+            written.update((pk, order + delta) for pk, order in qs.values_list('pk', 'order'))
+        with atomic(using=qs.db, savepoint=False):
+            offset = cls._order_offset(qs.db)
+            if offset is None:
+                qs.update(order=F('order') + delta)
+                return
+            qs.update(order=F('order') + offset)
+            parked = cls._base_manager.using(qs.db).filter(order__gte=offset)
+            if obj is not None:
+                cls._base_manager.using(qs.db).filter(pk=obj.pk).update(order=F('order') + offset)
+                parked = parked.exclude(pk=obj.pk)
+            parked.update(order=F('order') + (delta - offset))
+
+    @classmethod
+    def _close_gaps(cls, using, key, orders):
+        """
+        Close the gaps the deleted objects with the given ``orders`` left in
+        the stack ``key``, according to ``order_delete_policy``. With
+        ``'lazy'`` they are left for ``compact(fragmented=True)``.
+        """
+        if cls.order_delete_policy == 'eager':
+            cls._shift_after_deleted(using, key, orders)
+
+    @classmethod
+    def _shift_after_deleted(cls, using, key, orders):
+        attnames = cls._get_order_with_respect_to_attnames()
+        orders = sorted(orders)
+        following = cls._default_manager.using(using).filter(
+            **dict(zip(attnames, key))).filter(order__gt=orders[0])
+        if len(orders) == 1:
+            cls._shift_orders(following, -1)
+            return
+        offset = cls._order_offset(using)
+        if offset is None:
+            offset = 0
+        else:
+            following.update(order=F('order') + offset)
+        # Move every object up by the number of deleted objects above it.
+        connection = connections[using]
+        qn = connection.ops.quote_name
+        column_names = dict((f.attname, f.column) for f in cls._meta.fields)
+        order = qn(column_names['order'])
+        conditions = ['%s > %d' % (order, orders[0] + offset)]
+        params = []
+        for attname, value in zip(attnames, key):
+            if value is None:
+                conditions.append('%s IS NULL' % qn(column_names[attname]))
+            else:
+                conditions.append('%s = %%s' % qn(column_names[attname]))
+                params.append(value)
+        shifts = ' '.join([
+            'WHEN %s > %d THEN %d' % (order, orders[i] + offset, offset + i + 1)
+            for i in range(len(orders) - 1, -1, -1)
+        ])
+        connection.cursor().execute('UPDATE %s SET %s = %s - CASE %s END WHERE %s' % (
+            qn(cls._meta.db_table), order, order, shifts, ' AND '.join(conditions)
+        ), params)
+        transaction.set_dirty(using=using)
+
+    @classmethod
+    def _block_orders(cls, others, lower, upper, count):
+        step = cls.order_step
+        if step > 1:
+            orders, objs = cls._sparse_orders(others, lower, upper, count)
+            if objs:
+                _update_orders(cls, others.db, [(obj.pk, obj.order) for obj in objs])
+            return orders
+        if upper is None:
+            return cls._next_orders(lower, count)
+        floor = -1 if lower is None else lower
+        gap = (upper - floor) // (count + 1)
+        if gap < 1:
+            cls._shift_orders(others.filter(order__gte=upper), count)
+            return list(range(upper, upper + count))
+        return [floor + gap * (i + 1) for i in range(count)]
+
+    @_instrumented('to')
     def to(self, order):
         """
         Move object to a certain position, updating all affected objects to move accordingly up or down.
@@ -127,61 +1307,493 @@ class OrderedModel(models.Model):
             # object is already at desired position
             return
         qs = self.get_ordering_queryset()
-        if self.order > order:
-            qs.filter(order__lt=self.order, order__gte=order).update(order=F('order') + 1)
+        if self.order_step > 1:
+            # Only the objects at consecutive orders from the new one on
+            # are in the way.
+            delta = 1 if self.order > order else -1
+            run = self._run_length(order, delta)
+            if not run:
+                self.order = order
+                self._save_order()
+            elif delta > 0:
+                self._shift_and_save(qs.filter(order__gte=order, order__lt=order + run), 1, order)
+            else:
+                self._shift_and_save(qs.filter(order__lte=order, order__gt=order - run), -1, order)
+        elif self.order > order:
+            self._shift_and_save(qs.filter(order__lt=self.order, order__gte=order), 1, order)
         else:
-            qs.filter(order__gt=self.order, order__lte=order).update(order=F('order') - 1)
-        self.order = order
-        self.save()
+            self._shift_and_save(qs.filter(order__gt=self.order, order__lte=order), -1, order)
+
+    def _run_length(self, order, delta):
+        """
+        Return the number of other objects at the consecutive orders
+        ``order``, ``order + delta``, ... of this stack, reading twice as many
+        orders each time the run goes on.
+        """
+        qs = self.get_ordering_queryset().exclude(pk=self.pk)
+        size = 1
+        while True:
+            if delta > 0:
+                window = qs.filter(order__gte=order, order__lt=order + size)
+            else:
+                window = qs.filter(order__lte=order, order__gt=order - size)
+            orders = set(window.values_list('order', flat=True))
+            run = 0
+            while order + delta * run in orders:
+                run += 1
+            if run < size:
+                return run
+            size *= 2
 
+    def _shift_and_save(self, shifted, delta, order):
+        """
+        Add ``delta`` to the orders of the objects in ``shifted`` and write
+        ``order`` as the new order of this object, in one transaction.
+        """
+        with atomic(using=shifted.db, savepoint=False):
+            self._shift_orders(shifted, delta, self)
+            self.order = order
+            self._save_order(shifted.db)
+
+    def _leave_stack(self, using):
+        if self.order_step == 1:
+            following = self.get_ordering_queryset().using(using).filter(order__gt=self.order)
+            self._shift_orders(following, -1, self)
+
+    def _enter_stack(self, using, position):
+        if self.order_step > 1 or position is None:
+            return super(OrderedModel, self)._enter_stack(using, position)
+        stack = self.get_ordering_queryset().using(using)
+        refs = list(stack.order_by('order', 'pk')[position:position + 1])
+        if not refs:
+            return super(OrderedModel, self)._enter_stack(using, None)
+        self._shift_orders(stack.filter(order__gte=refs[0].order), 1)
+        self.order = refs[0].order
+        self._save_group(using)
+
+    @_instrumented('above')
     def above(self, ref):
         """
         Move this object above the referenced object.
         """
-        if not self._valid_ordering_reference(ref):
-            raise ValueError(
-                "%r can only be moved above instances of %r which %s equals %r." % (
-                    self, self.__class__, self.order_with_respect_to,
-                    self._get_order_with_respect_to()
-                )
-            )
+        self._check_ordering_reference(ref, 'moved above')
         if self.order == ref.order:
             return
+        if self.order_step > 1:
+            o = self.get_ordering_queryset().filter(order__lt=ref.order).aggregate(Max('order')).get('order__max')
+            if o != self.order:
+                self._save_between(o, ref.order)
+            return
+        # Shift the objects between this one and the reference, then take the
+        # order right above the reference without looking up its neighbour.
+        qs = self.get_ordering_queryset()
         if self.order > ref.order:
-            o = ref.order
+            self._shift_and_save(qs.filter(order__lt=self.order, order__gte=ref.order), 1, ref.order)
         else:
-            o = self.get_ordering_queryset().filter(order__lt=ref.order).aggregate(Max('order')).get('order__max') or 0
-        self.to(o)
+            self._shift_and_save(qs.filter(order__gt=self.order, order__lt=ref.order), -1, ref.order - 1)
 
+    @_instrumented('below')
     def below(self, ref):
         """
         Move this object below the referenced object.
         """
-        if not self._valid_ordering_reference(ref):
-            raise ValueError(
-                "%r can only be moved below instances of %r which %s equals %r." % (
-                    self, self.__class__, self.order_with_respect_to,
-                    self._get_order_with_respect_to()
-                )
-            )
+        self._check_ordering_reference(ref, 'moved below')
         if self.order == ref.order:
             return
+        if self.order_step > 1:
+            o = self.get_ordering_queryset().filter(order__gt=ref.order).aggregate(Min('order')).get('order__min')
+            if o != self.order:
+                self._save_between(ref.order, o)
+            return
+        qs = self.get_ordering_queryset()
         if self.order > ref.order:
-            o = self.get_ordering_queryset().filter(order__gt=ref.order).aggregate(Min('order')).get('order__min') or 0
+            self._shift_and_save(qs.filter(order__lt=self.order, order__gt=ref.order), 1, ref.order + 1)
         else:
-            o = ref.order
-        self.to(o)
+            self._shift_and_save(qs.filter(order__gt=self.order, order__lte=ref.order), -1, ref.order)
 
+    @_instrumented('top')
     def top(self):
         """
         Move this object to the top of the ordered stack.
         """
         o = self.get_ordering_queryset().aggregate(Min('order')).get('order__min')
+        if self.order_step > 1:
+            if o != self.order:
+                self._save_between(None, o)
+            return
         self.to(o)
 
+    @_instrumented('bottom')
     def bottom(self):
         """
         Move this object to the bottom of the ordered stack.
         """
         o = self.get_ordering_queryset().aggregate(Max('order')).get('order__max')
+        if self.order_step > 1:
+            if o != self.order:
+                self._save_between(o, None)
+            return
         self.to(o)
+
+    @classmethod
+    def compact(cls, group=None, using=None, chunk_size=1000, fragmented=False):
+        """
+        Renumber the orders of a stack to 0, 1, 2, ... (multiplied by
+        ``order_step``), closing the gaps left by deleted objects. ``group``
+        is the ``order_with_respect_to`` value of the stack; all stacks are
+        compacted when it is None, or with ``fragmented`` only those that
+        aren't numbered like that, see ``fragmented_stacks()``. Returns the
+        number of objects written.
+
+        PostgreSQL renumbers with a single statement using a window
+        function. Other databases compact one stack after the other, writing
+        ``chunk_size`` objects per statement.
+        """
+        using = using or router.db_for_write(cls)
+        if fragmented and group is None:
+            return sum([cls._compact(using, key, chunk_size) for key in cls.fragmented_stacks(using)])
+        key = None
+        if cls.order_with_respect_to and group is not None:
+            key = cls._get_order_with_respect_to_key(group)
+        return cls._compact(using, key, chunk_size)
+
+    @classmethod
+    def fragmented_stacks(cls, using=None):
+        """
+        Return the ``order_with_respect_to`` keys of the stacks whose orders
+        aren't 0, 1, 2, ... (multiplied by ``order_step``), e.g. those with
+        gaps left by deleted objects, found with one grouped query.
+        """
+        attnames = cls._get_order_with_respect_to_attnames()
+        qs = cls._default_manager.using(using or router.db_for_write(cls)).order_by()
+        if attnames:
+            rows = qs.values(*attnames).annotate(count=Count('pk'), low=Min('order'), high=Max('order'))
+        else:
+            rows = [qs.aggregate(count=Count('pk'), low=Min('order'), high=Max('order'))]
+        return [tuple(row[attname] for attname in attnames) for row in rows
+                if row['count'] and (row['low'] != 0 or row['high'] != (row['count'] - 1) * cls.order_step)]
+
+    @classmethod
+    def _compact(cls, using, key, chunk_size=1000):
+        attnames = cls._get_order_with_respect_to_attnames()
+        qs = cls._default_manager.using(using).order_by()
+        if not attnames:
+            key = None
+            keys = [()]
+        elif key is not None:
+            keys = [key]
+        else:
+            keys = None
+        if connections[using].vendor == 'postgresql':
+            with atomic(using=using, savepoint=False):
+                offset = cls._order_offset(using)
+                if offset is not None:
+                    stacks = cls._default_manager.using(using)
+                    if key is not None:
+                        stacks = stacks.filter(**dict(zip(attnames, key)))
+                    stacks.update(order=F('order') + offset)
+                count = cls._compact_with_window_function(using, attnames, key)
+            if cls._get_order_cache() is not None:
+                if keys is None:
+                    keys = list(qs.values_list(*attnames).distinct())
+                cls._clear_order_cache(using, keys)
+            return count
+        if keys is None:
+            keys = list(qs.values_list(*attnames).distinct())
+        count = 0
+        for key in keys:
+            rows = qs.filter(**dict(zip(attnames, key))).order_by('order', 'pk').values_list('pk', 'order')
+            changed = []
+            with atomic(using=using, savepoint=False):
+                for position, (pk, order) in enumerate(rows.iterator()):
+                    if order != position * cls.order_step:
+                        changed.append((pk, position * cls.order_step))
+                for i in range(0, len(changed), chunk_size):
+                    _update_orders(cls, using, changed[i:i + chunk_size])
+            count += len(changed)
+        cls._clear_order_cache(using, keys)
+        return count
+
+    @classmethod
+    def _compact_with_window_function(cls, using, attnames, key):
+        connection = connections[using]
+        qn = connection.ops.quote_name
+        table = qn(cls._meta.db_table)
+        pk = qn(cls._meta.pk.column)
+        order = qn(cls._meta.get_field('order').column)
+        column_names = dict((f.attname, f.column) for f in cls._meta.fields)
+        columns = [qn(column_names[attname]) for attname in attnames]
+        partition = where = ''
+        params = [cls.order_step]
+        if columns:
+            partition = 'PARTITION BY %s ' % ', '.join(columns)
+        if key is not None:
+            where = 'WHERE %s' % ' AND '.join(['%s = %%s' % column for column in columns])
+            params.extend(key)
+        cursor = connection.cursor()
+        cursor.execute(
+            'UPDATE %(table)s SET %(order)s = positions.position '
+            'FROM (SELECT %(pk)s, (ROW_NUMBER() OVER (%(partition)sORDER BY %(order)s, %(pk)s) - 1) * %%s '
+            'AS position FROM %(table)s %(where)s) positions '
+            'WHERE %(table)s.%(pk)s = positions.%(pk)s AND %(table)s.%(order)s <> positions.position' % {
+                'table': table, 'pk': pk, 'order': order, 'partition': partition, 'where': where,
+            }, params)
+        transaction.set_dirty(using=using)
+        return cursor.rowcount
+
+    def _save_between(self, lower, upper):
+        """
+        Write a free order between the orders ``lower`` and ``upper`` as the
+        order of this object, together with the orders of the objects moved
+        to make room for it, in one statement.
+        """
+        using = router.db_for_write(self.__class__, instance=self)
+        with atomic(using=using, savepoint=False):
+            self.order, others = self._order_between(lower, upper)
+            self._save_order(using, others)
+
+    def _order_between(self, lower, upper):
+        """
+        Return a free order value between the orders ``lower`` and ``upper``
+        (``None`` meaning no bound) for sparse ordering, and the objects
+        following it that were given new orders to make room for it.
+        """
+        orders, objs = self._sparse_orders(
+            self.get_ordering_queryset().exclude(pk=self.pk), lower, upper, 1)
+        return orders[0], objs
+
+    @classmethod
+    def _sparse_orders(cls, others, lower, upper, count):
+        """
+        Return ``count`` ascending free orders between the orders ``lower``
+        and ``upper`` (``None`` meaning no bound) among the objects of the
+        queryset ``others``, and those of them that were given new orders to
+        make room, for the caller to write.
+
+        If the gap between the two has run out, the objects from ``upper`` on
+        are spread evenly up to the next object leaving gaps of at least a
+        quarter of ``order_step``, doubling the number of spread objects until
+        there is one. Only when the end of the stack is reached are all
+        objects from ``upper`` on given new orders, at most ``count`` times
+        ``order_step`` past the last one.
+        """
+        step = cls.order_step
+        if upper is None:
+            return cls._next_orders(lower, count), []
+        if lower is None and upper >= count * step:
+            return [upper - step * (count - i) for i in range(count)], []
+        floor = -1 if lower is None else lower
+        gap = (upper - floor) // (count + 1)
+        if gap >= 1:
+            return [floor + gap * (i + 1) for i in range(count)], []
+        following = others.filter(order__gte=upper).order_by('order', 'pk')
+        size = 1
+        while True:
+            objs = list(following[:size + 1])
+            if len(objs) <= size:
+                gap = (objs[-1].order + count * step + 1 - floor) // (len(objs) + count + 1)
+                break
+            gap = (objs.pop().order - floor) // (len(objs) + count + 1)
+            if gap >= max(step // 4, 1):
+                break
+            size *= 2
+        for i, obj in enumerate(objs):
+            obj.order = floor + gap * (count + i + 1)
+        return [floor + gap * (i + 1) for i in range(count)], objs
+
+
+class RankedModel(OrderedModelBase):
+    """
+    An abstract model that allows objects to be ordered relative to each other
+    by a string rank. A rank can be generated between any two others, so every
+    move only writes the moved object. Provides an ``order`` field.
+    """
+
+    order = models.CharField(max_length=255, editable=False, db_index=True)
+
+    class Meta:
+        abstract = True
+        ordering = ('order',)
+
+    # Django 1.4 converts the results of Max and Min aggregates of string
+    # fields to floats on most databases.
+
+    @staticmethod
+    def _max_order(qs):
+        orders = qs.order_by('-order').values_list('order', flat=True)[:1]
+        return orders[0] if orders else None
+
+    @staticmethod
+    def _min_order(qs):
+        orders = qs.order_by('order').values_list('order', flat=True)[:1]
+        return orders[0] if orders else None
+
+    @classmethod
+    def _next_orders(cls, last, count):
+        return ranks_between(last, None, count)
+
+    @classmethod
+    def _block_orders(cls, others, lower, upper, count):
+        ranks = ranks_between(lower, upper, count)
+        if ranks and max(len(rank) for rank in ranks) > cls._meta.get_field('order').max_length - RANK_WIDTH:
+            # The ranks are nearing the length of the order field, so spread
+            # the others over short ranks again, between the same neighbours.
+            ranks = cls._spread_ranks(others)
+            position = len([old for old, new in ranks if lower is not None and old <= lower])
+            lower = ranks[position - 1][1] if position else None
+            upper = ranks[position][1] if position < len(ranks) else None
+            ranks = ranks_between(lower, upper, count)
+        return ranks
+
+    @classmethod
+    def _spread_ranks(cls, stack, chunk_size=1000):
+        """
+        Give the objects of the queryset ``stack`` evenly spread ranks of at
+        most ``RANK_WIDTH`` digits, keeping their order, and return their
+        old and new ranks as ``(old, new)`` pairs in stack order. Meant to be
+        called inside a transaction.
+        """
+        rows = list(stack.order_by('order', 'pk').values_list('pk', 'order'))
+        ranks = spread_ranks(len(rows))
+        changed = [(pk, rank) for (pk, order), rank in zip(rows, ranks) if order != rank]
+        for i in range(0, len(changed), chunk_size):
+            _update_orders(cls, stack.db, changed[i:i + chunk_size])
+        return [(order, rank) for (pk, order), rank in zip(rows, ranks)]
+
+    @classmethod
+    def compact(cls, group=None, using=None, chunk_size=1000):
+        """
+        Give the objects of a stack evenly spread ranks of at most
+        ``RANK_WIDTH`` digits again, keeping their order. ``group`` is the
+        ``order_with_respect_to`` value of the stack; all stacks are
+        compacted when it is None. Returns the number of objects written.
+
+        Moves compact a stack by themselves when its ranks near the length of
+        the ``order`` field.
+        """
+        using = using or router.db_for_write(cls)
+        attnames = cls._get_order_with_respect_to_attnames()
+        qs = cls._default_manager.using(using).order_by()
+        if not attnames:
+            keys = [()]
+        elif group is not None:
+            keys = [cls._get_order_with_respect_to_key(group)]
+        else:
+            keys = list(qs.values_list(*attnames).distinct())
+        count = 0
+        for key in keys:
+            with atomic(using=using, savepoint=False):
+                ranks = cls._spread_ranks(qs.filter(**dict(zip(attnames, key))), chunk_size)
+            count += len([old for old, new in ranks if old != new])
+        cls._clear_order_cache(using, keys)
+        return count
+
+    def _move_between(self, lower, upper):
+        using = router.db_for_write(self.__class__, instance=self)
+        with atomic(using=using, savepoint=False):
+            others = self.get_ordering_queryset().using(using).exclude(pk=self.pk)
+            self.order, = self._block_orders(others, lower, upper, 1)
+            self._save_order(using)
+
+    @_instrumented('to')
+    def to(self, position):
+        """
+        Move this object to a certain position, counting from 0, among the
+        other objects of its stack.
+        """
+        if position is None:
+            return
+        others = self.get_ordering_queryset().exclude(pk=self.pk).order_by('order')
+        neighbours = list(others.values_list('order', flat=True)[max(position - 1, 0):position + 1])
+        if position == 0:
+            lower, upper = None, (neighbours[0] if neighbours else None)
+        elif not neighbours:
+            return self.bottom()
+        else:
+            lower, upper = neighbours[0], (neighbours[1] if len(neighbours) > 1 else None)
+        if (lower is None or lower < self.order) and (upper is None or self.order < upper):
+            # object is already at desired position
+            return
+        self._move_between(lower, upper)
+
+    @_instrumented('above')
+    def above(self, ref):
+        """
+        Move this object above the referenced object.
+        """
+        self._check_ordering_reference(ref, 'moved above')
+        if self.order == ref.order:
+            return
+        o = self._max_order(self.get_ordering_queryset().filter(order__lt=ref.order))
+        if o != self.order:
+            self._move_between(o, ref.order)
+
+    @_instrumented('below')
+    def below(self, ref):
+        """
+        Move this object below the referenced object.
+        """
+        self._check_ordering_reference(ref, 'moved below')
+        if self.order == ref.order:
+            return
+        o = self._min_order(self.get_ordering_queryset().filter(order__gt=ref.order))
+        if o != self.order:
+            self._move_between(ref.order, o)
+
+    @_instrumented('top')
+    def top(self):
+        """
+        Move this object to the top of the ordered stack.
+        """
+        o = self._min_order(self.get_ordering_queryset())
+        if o != self.order:
+            self._move_between(None, o)
+
+    @_instrumented('bottom')
+    def bottom(self):
+        """
+        Move this object to the bottom of the ordered stack.
+        """
+        o = self._max_order(self.get_ordering_queryset())
+        if o != self.order:
+            self._move_between(o, None)
+
+
+def _needs_order_index(model):
+    if not issubclass(model, OrderedModelBase) or not model.order_with_respect_to:
+        return False
+    if model._meta.abstract or model._meta.proxy:
+        return False
+    if 'order' not in [field.name for field in model._meta.local_fields]:
+        return False
+    # a unique constraint comes with an index of its own
+    return not model._order_is_unique()
+
+
+def _add_order_index(sender, **kwargs):
+    """
+    Add the ``order_with_respect_to`` field and ``order`` of ordered models to
+    their ``index_together``, for ``syncdb`` to create a composite index.
+    """
+    if _needs_order_index(sender):
+        fields = tuple(sender._get_order_with_respect_to_fields()) + ('order',)
+        if fields not in [tuple(together) for together in sender._meta.index_together]:
+            sender._meta.index_together = list(sender._meta.index_together) + [fields]
+
+
+def _create_order_indexes(sender, created_models, db, **kwargs):
+    """
+    Create the composite index of the ordered models ``syncdb`` created, on
+    Django versions without ``index_together``.
+    """
+    for model in created_models:
+        # sent once per app with the models of all apps, and by flush too
+        if (_needs_order_index(model) and models.get_app(model._meta.app_label) is sender
+                and not order_index_exists(model, db)):
+            add_order_index(model, db)
+
+
+if 'index_together' in DEFAULT_NAMES:
+    signals.class_prepared.connect(_add_order_index)
+else:  # Django < 1.5
+    signals.post_syncdb.connect(_create_order_indexes)
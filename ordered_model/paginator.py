@@ -0,0 +1,95 @@
+"""
+Keyset pagination for ordered models.
+
+Django's ``Paginator`` reads page ``n`` with ``OFFSET (n - 1) * per_page``,
+so the database walks all preceding rows. ``KeysetPaginator`` instead
+continues after the last object of the previous page, using its stack, order
+and primary key as the cursor, so that every page costs as much as the first.
+Pages are addressed by cursors rather than numbers.
+"""
+from django.core.paginator import EmptyPage
+from django.utils.functional import cached_property
+
+
+class KeysetPaginator(object):
+    """
+    Paginates a queryset of an ordered model in stack order. ``orphans`` and
+    ``allow_empty_first_page`` are accepted for compatibility with the
+    ``get_paginator()`` hook of the admin and otherwise ignored.
+    """
+
+    def __init__(self, object_list, per_page, orphans=0, allow_empty_first_page=True):
+        self.object_list = object_list
+        self.per_page = int(per_page)
+
+    @cached_property
+    def count(self):
+        return self.object_list.count()
+
+    def page(self, after=None, before=None):
+        """
+        Return the page following the object ``after`` or preceding the
+        object ``before``, objects or their primary keys, or the first page if
+        neither is given.
+        """
+        model = self.object_list.model
+        try:
+            if before is not None:
+                objects = list(self.object_list.before(before)[:self.per_page + 1])
+                has_previous = len(objects) > self.per_page
+                objects = objects[:self.per_page][::-1]
+                has_next = True
+            else:
+                if after is not None:
+                    qs = self.object_list.after(after)
+                else:
+                    qs = self.object_list.order_by(*self.object_list._keyset_ordering())
+                objects = list(qs[:self.per_page + 1])
+                has_next = len(objects) > self.per_page
+                objects = objects[:self.per_page]
+                has_previous = after is not None
+        except (model.DoesNotExist, ValueError):
+            raise EmptyPage("That cursor is not valid.")
+        return KeysetPage(objects, self, has_next, has_previous)
+
+
+class KeysetPage(object):
+
+    def __init__(self, object_list, paginator, has_next, has_previous):
+        self.object_list = object_list
+        self.paginator = paginator
+        self._has_next = has_next
+        self._has_previous = has_previous
+
+    def __repr__(self):
+        return '<KeysetPage of %d objects>' % len(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __getitem__(self, index):
+        return self.object_list[index]
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def has_next(self):
+        return self._has_next and bool(self.object_list)
+
+    def has_previous(self):
+        return self._has_previous and bool(self.object_list)
+
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
+
+    def next_cursor(self):
+        """
+        Return the cursor of the next page, to be passed as ``after``.
+        """
+        return self.object_list[-1].pk if self.has_next() else None
+
+    def previous_cursor(self):
+        """
+        Return the cursor of the previous page, to be passed as ``before``.
+        """
+        return self.object_list[0].pk if self.has_previous() else None
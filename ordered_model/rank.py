@@ -0,0 +1,99 @@
+"""
+Generation of string ranks for ``RankedModel``.
+
+A rank is a base 36 fraction written with the digits ``0-9a-z``, so ranks sort
+the same way as strings in the database as they do as numbers. The first
+``RANK_WIDTH`` digits are the integer part, which lets objects appended to or
+prepended to a stack get ranks of constant length. Ranks never end in ``0``,
+so there always is another rank in between any two of them. Ranks inserted
+at the same place again and again grow longer; ``spread_ranks()`` gives a
+stack short ranks again.
+"""
+
+RANK_DIGITS = '0123456789abcdefghijklmnopqrstuvwxyz'
+RANK_WIDTH = 6
+
+_BASE = len(RANK_DIGITS)
+_MAX = _BASE ** RANK_WIDTH
+
+
+def _encode(number):
+    digits = []
+    for i in range(RANK_WIDTH):
+        number, digit = divmod(number, _BASE)
+        digits.append(RANK_DIGITS[digit])
+    return ''.join(reversed(digits)).rstrip('0')
+
+
+def _integer_part(rank):
+    return int(rank[:RANK_WIDTH].ljust(RANK_WIDTH, '0'), _BASE)
+
+
+def _midpoint(lower, upper):
+    # Both are tails of ranks, ``upper`` may be None for no upper bound.
+    if upper is not None:
+        n = 0
+        while n < len(upper) and (lower[n] if n < len(lower) else '0') == upper[n]:
+            n += 1
+        if n > 0:
+            return upper[:n] + _midpoint(lower[n:], upper[n:])
+    digit_lower = RANK_DIGITS.index(lower[0]) if lower else 0
+    digit_upper = RANK_DIGITS.index(upper[0]) if upper is not None else _BASE
+    if digit_upper - digit_lower > 1:
+        return RANK_DIGITS[(digit_lower + digit_upper) // 2]
+    if upper is not None and len(upper) > 1:
+        return upper[0]
+    return RANK_DIGITS[digit_lower] + _midpoint(lower[1:], None)
+
+
+def rank_between(lower, upper):
+    """
+    Return a rank sorting after ``lower`` and before ``upper``. Either may be
+    ``None`` for no bound.
+    """
+    if lower is None and upper is None:
+        return _encode(_MAX // 2)
+    if upper is None:
+        number = _integer_part(lower) + 1
+        if number < _MAX:
+            return _encode(number)
+    elif lower is None:
+        number = _integer_part(upper)
+        if len(upper) <= RANK_WIDTH:
+            number -= 1
+        if number > 0:
+            return _encode(number)
+    elif lower >= upper:
+        raise ValueError("%r does not sort before %r." % (lower, upper))
+    return _midpoint(lower or '', upper)
+
+
+def spread_ranks(count):
+    """
+    Return ``count`` ascending ranks of at most ``RANK_WIDTH`` digits, spread
+    evenly over all of them.
+    """
+    return [_encode((i + 1) * _MAX // (count + 1)) for i in range(count)]
+
+
+def ranks_between(lower, upper, count):
+    """
+    Return ``count`` ascending ranks between ``lower`` and ``upper``. Either
+    may be ``None`` for no bound.
+    """
+    ranks = []
+    if upper is None:
+        for i in range(count):
+            lower = rank_between(lower, None)
+            ranks.append(lower)
+    elif lower is None:
+        for i in range(count):
+            upper = rank_between(None, upper)
+            ranks.insert(0, upper)
+    elif count:
+        # bisect, to keep the ranks as short as possible
+        middle = rank_between(lower, upper)
+        half = count // 2
+        ranks = ranks_between(lower, middle, half) + [middle] + \
+            ranks_between(middle, upper, count - half - 1)
+    return ranks
@@ -0,0 +1,17 @@
+"""
+Signals sent by ordered models.
+"""
+from django.dispatch import Signal
+
+# Sent after an object was inserted into its stack, moved with swap() (and so
+# up() and down()), to(), above(), below(), top() or bottom(), or deleted.
+# ``group`` is the order_with_respect_to key of the stack, ``old_order`` and
+# ``new_order`` the order of the object before and after (None when it was
+# inserted or deleted), ``rows_written`` the number of rows the statements
+# wrote, the object's own included, ``statements`` their number and
+# ``elapsed`` the seconds the operation took. The operation is only measured
+# while a receiver is connected.
+order_changed = Signal(providing_args=[
+    'instance', 'operation', 'group', 'old_order', 'new_order',
+    'rows_written', 'statements', 'elapsed', 'using',
+])
@@ -0,0 +1,86 @@
+/*
+ * Drag and drop reordering for the change list of OrderedModelAdmin.
+ *
+ * Rows showing the move_up_down_links can be dragged to a new place. On drop
+ * the primary keys of the rows are posted in their new order to the reorder
+ * view of the admin, which swaps the orders of these objects in one update.
+ */
+(function($) {
+    function csrfToken() {
+        var match = document.cookie.match(/(?:^|;\s*)csrftoken=([^;]+)/);
+        return match ? decodeURIComponent(match[1]) : '';
+    }
+
+    $(function() {
+        var tbody = $('#result_list tbody');
+        var rows = tbody.children('tr').has('.ordered-model-controls');
+        var dragged = null;
+        var initial = null;
+        if (rows.length < 2) {
+            return;
+        }
+
+        function ids() {
+            return tbody.find('.ordered-model-controls').map(function() {
+                return $(this).attr('data-id');
+            }).get();
+        }
+
+        function restripe() {
+            tbody.children('tr').each(function(i) {
+                $(this).removeClass('row1 row2').addClass(i % 2 ? 'row2' : 'row1');
+            });
+        }
+
+        rows.attr('draggable', 'true').css('cursor', 'move');
+        rows.bind('dragstart', function(event) {
+            dragged = this;
+            initial = ids().join(',');
+            event.originalEvent.dataTransfer.effectAllowed = 'move';
+            // Firefox only starts dragging with some data set
+            event.originalEvent.dataTransfer.setData('text', '');
+        });
+        rows.bind('dragover', function(event) {
+            if (!dragged) {
+                return;
+            }
+            event.preventDefault();
+            if (this !== dragged) {
+                if ($(dragged).index() < $(this).index()) {
+                    $(this).after(dragged);
+                } else {
+                    $(this).before(dragged);
+                }
+            }
+        });
+        rows.bind('drop', function(event) {
+            event.preventDefault();
+        });
+        rows.bind('dragend', function() {
+            var current = ids();
+            dragged = null;
+            restripe();
+            if (current.join(',') === initial) {
+                return;
+            }
+            $.ajax({
+                type: 'POST',
+                url: 'reorder/',
+                data: {ids: current},
+                traditional: true,
+                dataType: 'json',
+                beforeSend: function(xhr) {
+                    xhr.setRequestHeader('X-CSRFToken', csrfToken());
+                },
+                error: function(xhr) {
+                    var message = 'The new order could not be saved.';
+                    try {
+                        message = $.parseJSON(xhr.responseText).error || message;
+                    } catch (e) {}
+                    alert(message);
+                    window.location.reload();
+                }
+            });
+        });
+    });
+})(django.jQuery);
@@ -0,0 +1,32 @@
+from django.contrib import admin
+
+from ordered_model.admin import OrderedModelAdmin, OrderedTabularInline
+from ordered_model.tests.models import Item, Pizza, PizzaToppingsThroughModel
+
+
+class ItemAdmin(OrderedModelAdmin):
+    list_display = ('name', 'move_up_down_links')
+
+
+class PizzaToppingsThroughModelInline(OrderedTabularInline):
+    model = PizzaToppingsThroughModel
+    fields = ('topping', 'order', 'move_up_down_links',)
+    readonly_fields = ('order', 'move_up_down_links',)
+    extra = 1
+    ordering = ('order',)
+
+
+class PizzaAdmin(admin.ModelAdmin):
+    list_display = ('name', )
+    inlines = (PizzaToppingsThroughModelInline, )
+
+    def get_urls(self):
+        urls = super(PizzaAdmin, self).get_urls()
+        for inline in self.inlines:
+            if hasattr(inline, 'get_urls'):
+                urls = inline.get_urls(self) + urls
+        return urls
+
+
+admin.site.register(Item, ItemAdmin)
+admin.site.register(Pizza, PizzaAdmin)
@@ -1,11 +1,20 @@
 from django.db import models
-from ordered_model.models import OrderedModel
+from ordered_model.models import OrderedModel, RankedModel
 
 
 class Item(OrderedModel):
     name = models.CharField(max_length=100)
 
 
+class SparseItem(OrderedModel):
+    name = models.CharField(max_length=100)
+    order_step = 100
+
+
+class RankedItem(RankedModel):
+    name = models.CharField(max_length=100)
+
+
 class Question(models.Model):
     pass
 
@@ -21,6 +30,28 @@ class Answer(OrderedModel):
         return u"Answer #%d of question #%d" % (self.order, self.question_id)
 
 
+class UniqueAnswer(OrderedModel):
+    question = models.ForeignKey(Question, related_name='unique_answers')
+    order_with_respect_to = 'question'
+
+    class Meta:
+        ordering = ('question', 'order')
+        unique_together = ('question', 'order')
+
+
+class Board(models.Model):
+    pass
+
+
+class Card(OrderedModel):
+    board = models.ForeignKey(Board, related_name='cards')
+    column = models.CharField(max_length=20)
+    order_with_respect_to = ('board', 'column')
+
+    class Meta:
+        ordering = ('board', 'column', 'order')
+
+
 class Topping(models.Model):
     name = models.CharField(max_length=100)
 
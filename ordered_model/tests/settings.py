@@ -8,7 +8,12 @@ DATABASES = {
 }
 ROOT_URLCONF = 'ordered_model.tests.urls'
 INSTALLED_APPS = [
+    'django.contrib.auth',
+    'django.contrib.contenttypes',
+    'django.contrib.sessions',
+    'django.contrib.admin',
     'ordered_model',
     'ordered_model.tests',
 ]
 SECRET_KEY = 'topsecret'
+STATIC_URL = '/static/'
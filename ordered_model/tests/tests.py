@@ -1,5 +1,6 @@
-from django.test import TestCase
-from ordered_model.tests.models import Answer, Item, Question, Pizza, Topping, PizzaToppingsThroughModel
+from django.test import TestCase, TransactionTestCase
+from ordered_model.rank import RANK_WIDTH
+from ordered_model.tests.models import Answer, Item, Question, Pizza, Topping, PizzaToppingsThroughModel, RankedItem, SparseItem, UniqueAnswer, Board, Card
 
 
 class OrderGenerationTests(TestCase):
@@ -267,3 +268,1496 @@ class OrderWithRespectToTestsManyToMany(TestCase):
             (self.p1_t1.topping.pk, 0), (self.p1_t2.topping.pk, 1), (self.p1_t3.topping.pk, 2),
             (self.p2_t2.topping.pk, 0), (self.p2_t3.topping.pk, 1), (self.p2_t4.topping.pk, 2), (self.p2_t1.topping.pk, 3)
         ])
+
+
+class BulkCreateTests(TestCase):
+    def test_bulk_create(self):
+        Item.objects.create(name='1')
+        Item.objects.bulk_create([Item(name='2'), Item(name='3')])
+        self.assertSequenceEqual(
+            Item.objects.values_list('name', 'order'), [
+            ('1', 0), ('2', 1), ('3', 2)
+        ])
+
+    def test_bulk_create_with_respect_to(self):
+        q1 = Question.objects.create()
+        q2 = Question.objects.create()
+        q1_a1 = q1.answers.create()
+        with self.assertNumQueries(2):
+            q1_a2, q2_a1, q1_a3 = Answer.objects.bulk_create([
+                Answer(question=q1), Answer(question=q2), Answer(question=q1)
+            ])
+        self.assertSequenceEqual(
+            Answer.objects.values_list('question', 'order'), [
+            (q1.pk, 0), (q1.pk, 1), (q1.pk, 2), (q2.pk, 0)
+        ])
+
+    def test_bulk_create_batch_size(self):
+        Item.objects.bulk_create([Item(name=str(i)) for i in range(5)], batch_size=2)
+        self.assertSequenceEqual(
+            Item.objects.values_list('order', flat=True), [0, 1, 2, 3, 4])
+
+
+class NestedTransactionTests(TransactionTestCase):
+
+    def test_rollback_of_outer_block(self):
+        from django.db import transaction
+        outer = getattr(transaction, 'atomic', None) or transaction.commit_on_success
+        Item.objects.create(name='kept')
+        try:
+            with outer():
+                Item.objects.create(name='1')
+                Item.objects.bulk_create([Item(name='2'), Item(name='3')])
+                Item.objects.create_at(0, name='4')
+                Item.objects.all().to_top()
+                raise ValueError
+        except ValueError:
+            pass
+        self.assertSequenceEqual(Item.objects.values_list('name', 'order'), [('kept', 0)])
+
+    def test_order_cache_cleared_on_commit(self):
+        from django.db import transaction
+        from ordered_model.cache import LRUCache
+        outer = getattr(transaction, 'atomic', None) or transaction.commit_on_success
+        question = Question.objects.create()
+        a1, a2 = question.answers.create(), question.answers.create()
+        Answer.order_cache = LRUCache()
+        try:
+            with outer():
+                a2.top()
+                # another connection caches the stack it still sees
+                Answer.order_cache.set(Answer._order_cache_key('default', (question.pk,)), [a1.pk, a2.pk])
+            self.assertEqual(Answer.objects.get(pk=a2.pk).get_position(), 0)
+        finally:
+            Answer.order_cache = None
+
+
+class OrderLockTests(TestCase):
+    def setUp(self):
+        Answer.order_lock = True
+
+    def tearDown(self):
+        Answer.order_lock = False
+
+    def test_saved_order(self):
+        q1 = Question.objects.create()
+        q2 = Question.objects.create()
+        q1_a1 = q1.answers.create()
+        q2_a1 = q2.answers.create()
+        q1_a2 = q1.answers.create()
+        self.assertSequenceEqual(
+            Answer.objects.values_list('pk', 'order'), [
+            (q1_a1.pk, 0), (q1_a2.pk, 1), (q2_a1.pk, 0)
+        ])
+
+    def test_bulk_create(self):
+        q1 = Question.objects.create()
+        q2 = Question.objects.create()
+        locked = []
+        lock_ordering_group = Answer.lock_ordering_group
+
+        def lock(self, using):
+            locked.append(self.question_id)
+            lock_ordering_group(self, using)
+        Answer.lock_ordering_group = lock
+        try:
+            Answer.objects.bulk_create([Answer(question=q2), Answer(question=q1), Answer(question=q2)])
+        finally:
+            del Answer.lock_ordering_group
+        self.assertEqual(locked, [q1.pk, q2.pk])
+        self.assertSequenceEqual(
+            Answer.objects.values_list('question', 'order'), [(q1.pk, 0), (q2.pk, 0), (q2.pk, 1)])
+
+
+class SparseOrderingTests(TestCase):
+    def setUp(self):
+        self.a = SparseItem.objects.create(name='a')
+        self.b = SparseItem.objects.create(name='b')
+        self.c = SparseItem.objects.create(name='c')
+
+    def assertNames(self, names):
+        self.assertEqual(names, [(i.name, i.order) for i in SparseItem.objects.all()])
+
+    def test_saved_order(self):
+        self.assertNames([('a', 0), ('b', 100), ('c', 200)])
+
+    def test_bulk_create(self):
+        SparseItem.objects.bulk_create([SparseItem(name='d'), SparseItem(name='e')])
+        self.assertNames([('a', 0), ('b', 100), ('c', 200), ('d', 300), ('e', 400)])
+
+    def test_above(self):
+        self.c.above(self.b)
+        self.assertNames([('a', 0), ('c', 50), ('b', 100)])
+        self.b.above(self.c)
+        self.assertNames([('a', 0), ('b', 25), ('c', 50)])
+
+    def test_above_neighbour(self):
+        self.b.above(self.c)
+        self.assertNames([('a', 0), ('b', 100), ('c', 200)])
+
+    def test_above_rebalance(self):
+        # only a is moved to make room above it
+        self.c.above(self.a)
+        self.assertNames([('c', 32), ('a', 65), ('b', 100)])
+
+    def test_below(self):
+        self.a.below(self.b)
+        self.assertNames([('b', 100), ('a', 150), ('c', 200)])
+        self.c.below(self.b)
+        self.assertNames([('b', 100), ('c', 125), ('a', 150)])
+
+    def test_below_rebalance(self):
+        self.b.to(1)
+        self.c.below(self.a)
+        self.assertNames([('a', 0), ('c', 34), ('b', 68)])
+
+    def test_to(self):
+        # the order is free
+        with self.assertNumQueries(2):
+            self.c.to(50)
+        self.assertNames([('a', 0), ('c', 50), ('b', 100)])
+        # only a is in the way
+        self.c.to(0)
+        self.assertNames([('c', 0), ('a', 1), ('b', 100)])
+        self.b.to(1)
+        self.assertNames([('c', 0), ('b', 1), ('a', 2)])
+        SparseItem.objects.get(name='c').to(2)
+        self.assertNames([('b', 0), ('a', 1), ('c', 2)])
+
+    def test_local_rebalance(self):
+        SparseItem.objects.bulk_create([SparseItem(name=str(i)) for i in range(47)])
+        written = 0
+        for i in range(8):
+            before = dict(SparseItem.objects.values_list('pk', 'order'))
+            item = SparseItem.objects.order_by('-order')[0]
+            if i % 2:
+                item.above(SparseItem.objects.order_by('order')[0])
+            else:
+                item.top()
+            after = dict(SparseItem.objects.values_list('pk', 'order'))
+            written += len([pk for pk in after if after[pk] != before[pk]])
+            self.assertEqual(SparseItem.objects.order_by('order')[0].pk, item.pk)
+        self.assertEqual(len(set(after.values())), 50)
+        # fewer rows than a single shift of the whole stack
+        self.assertTrue(written < 50, written)
+
+    def test_top(self):
+        self.c.top()
+        self.assertNames([('c', 32), ('a', 65), ('b', 100)])
+        self.b.top()
+        self.assertNames([('b', 15), ('c', 32), ('a', 65)])
+        SparseItem.objects.get(name='b').bottom()
+        SparseItem.objects.get(name='a').top()
+        self.assertNames([('a', 15), ('c', 32), ('b', 165)])
+
+    def test_bottom(self):
+        self.a.bottom()
+        self.assertNames([('b', 100), ('c', 200), ('a', 300)])
+        self.c.bottom()
+        self.assertNames([('b', 100), ('a', 300), ('c', 400)])
+
+
+class RankedModelTests(TestCase):
+    def setUp(self):
+        self.a = RankedItem.objects.create(name='a')
+        self.b = RankedItem.objects.create(name='b')
+        self.c = RankedItem.objects.create(name='c')
+
+    def assertNames(self, names):
+        self.assertEqual(names, [i.name for i in RankedItem.objects.all()])
+
+    def test_saved_order(self):
+        self.assertNames(['a', 'b', 'c'])
+        self.assertTrue(self.a.order < self.b.order < self.c.order)
+
+    def test_bulk_create(self):
+        RankedItem.objects.bulk_create([RankedItem(name='d'), RankedItem(name='e')])
+        self.assertNames(['a', 'b', 'c', 'd', 'e'])
+
+    def test_up_down(self):
+        self.c.up()
+        self.assertNames(['a', 'c', 'b'])
+        self.a.down()
+        self.assertNames(['c', 'a', 'b'])
+
+    def test_swap(self):
+        self.a.swap([self.c])
+        self.assertNames(['c', 'b', 'a'])
+
+    def test_to(self):
+        self.a.to(2)
+        self.assertNames(['b', 'c', 'a'])
+        self.a.to(1)
+        self.assertNames(['b', 'a', 'c'])
+        self.c.to(0)
+        self.assertNames(['c', 'b', 'a'])
+        self.c.to(0)
+        self.assertNames(['c', 'b', 'a'])
+        self.c.to(10)
+        self.assertNames(['b', 'a', 'c'])
+
+    def test_above_below(self):
+        self.c.above(self.b)
+        self.assertNames(['a', 'c', 'b'])
+        self.a.below(self.b)
+        self.assertNames(['c', 'b', 'a'])
+        self.b.above(self.a)
+        self.assertNames(['c', 'b', 'a'])
+
+    def test_top_bottom(self):
+        self.c.top()
+        self.assertNames(['c', 'a', 'b'])
+        self.c.bottom()
+        self.assertNames(['a', 'b', 'c'])
+
+    def test_repeated_moves(self):
+        for i in range(50):
+            RankedItem.objects.get(name='c').above(RankedItem.objects.get(name='b'))
+            RankedItem.objects.get(name='b').above(RankedItem.objects.get(name='c'))
+        self.assertNames(['a', 'b', 'c'])
+
+
+class RankCompactTests(TestCase):
+
+    def setUp(self):
+        # ranks grown by many inserts at the same place
+        RankedItem.objects.bulk_create([
+            RankedItem(name='a', order='h' + 'z' * 248 + 'v'),
+            RankedItem(name='b', order='i'),
+            RankedItem(name='c', order='j'),
+        ])
+        self.a, self.b, self.c = RankedItem.objects.all()
+
+    def assertNames(self, names):
+        self.assertEqual(names, [i.name for i in RankedItem.objects.all()])
+        self.assertTrue(max(len(i.order) for i in RankedItem.objects.all()) <= RANK_WIDTH)
+
+    def test_move(self):
+        self.c.above(self.b)
+        self.assertNames(['a', 'c', 'b'])
+
+    def test_move_block(self):
+        RankedItem.objects.filter(pk=self.c.pk).move_below(self.a)
+        self.assertNames(['a', 'c', 'b'])
+
+    def test_compact(self):
+        # b keeps its rank
+        self.assertEqual(RankedItem.compact(), 2)
+        self.assertNames(['a', 'b', 'c'])
+        self.assertEqual(RankedItem.compact(), 0)
+
+
+class ReorderTests(TestCase):
+    fixtures = ['test_items.json']
+
+    def assertNames(self, names):
+        self.assertEqual(names, [(i.name, i.order) for i in Item.objects.all()])
+
+    def test_reorder(self):
+        with self.assertNumQueries(2):
+            changed = Item.objects.reorder([4, 1, 3, 2])
+        self.assertEqual(changed, {4: 0, 1: 1, 2: 6})
+        self.assertNames([('4', 0), ('1', 1), ('3', 5), ('2', 6)])
+
+    def test_reorder_subset(self):
+        Item.objects.reorder(['3', '1'])
+        self.assertNames([('3', 0), ('2', 1), ('1', 5), ('4', 6)])
+
+    def test_reorder_unchanged(self):
+        with self.assertNumQueries(1):
+            self.assertEqual(Item.objects.reorder([1, 2, 3, 4]), {})
+
+    def test_reorder_invalid(self):
+        with self.assertRaises(ValueError):
+            Item.objects.reorder([1, 1])
+        with self.assertRaises(ValueError):
+            Item.objects.reorder([1, 5])
+
+    def test_reorder_with_respect_to(self):
+        q1 = Question.objects.create()
+        q2 = Question.objects.create()
+        q1_a1 = q1.answers.create()
+        q1_a2 = q1.answers.create()
+        q2_a1 = q2.answers.create()
+        with self.assertRaises(ValueError):
+            Answer.objects.reorder([q1_a1.pk, q2_a1.pk])
+        with self.assertRaises(ValueError):
+            Answer.objects.reorder([q1_a2.pk, q1_a1.pk], within=q2)
+        Answer.objects.reorder([q1_a2.pk, q1_a1.pk], within=q1)
+        self.assertSequenceEqual(
+            Answer.objects.values_list('pk', 'order'), [
+            (q1_a2.pk, 0), (q1_a1.pk, 1), (q2_a1.pk, 0)
+        ])
+
+    def test_reorder_ranked(self):
+        a = RankedItem.objects.create(name='a')
+        b = RankedItem.objects.create(name='b')
+        RankedItem.objects.reorder([b.pk, a.pk])
+        self.assertEqual(['b', 'a'], [i.name for i in RankedItem.objects.all()])
+
+
+class MoveManyTests(TestCase):
+    fixtures = ['test_items.json']
+
+    def assertNames(self, names):
+        self.assertEqual(names, [(i.name, i.order) for i in Item.objects.all()])
+
+    def test_move_above(self):
+        ref = Item.objects.get(pk=2)
+        with self.assertNumQueries(4):
+            Item.objects.filter(pk__in=[3, 4]).move_above(ref)
+        self.assertNames([('1', 0), ('3', 1), ('4', 2), ('2', 3)])
+
+    def test_move_above_gap(self):
+        Item.objects.filter(pk__in=[1]).move_above(Item.objects.get(pk=3))
+        self.assertNames([('2', 1), ('1', 3), ('3', 5), ('4', 6)])
+
+    def test_move_below(self):
+        Item.objects.filter(pk__in=[1, 2]).move_below(Item.objects.get(pk=3))
+        self.assertNames([('3', 5), ('1', 6), ('2', 7), ('4', 8)])
+
+    def test_to_top(self):
+        Item.objects.filter(pk__in=[4, 2]).to_top()
+        self.assertNames([('2', 0), ('4', 1), ('1', 2), ('3', 7)])
+
+    def test_to_bottom(self):
+        with self.assertNumQueries(3):
+            Item.objects.filter(pk__in=[1, 3]).to_bottom()
+        self.assertNames([('2', 1), ('4', 6), ('1', 7), ('3', 8)])
+
+    def test_with_respect_to(self):
+        q1 = Question.objects.create()
+        q2 = Question.objects.create()
+        q1_a1 = q1.answers.create()
+        q1_a2 = q1.answers.create()
+        q1_a3 = q1.answers.create()
+        q2_a1 = q2.answers.create()
+        with self.assertRaises(ValueError):
+            Answer.objects.filter(pk__in=[q1_a3.pk, q2_a1.pk]).to_top()
+        with self.assertRaises(ValueError):
+            Answer.objects.filter(pk__in=[q1_a3.pk]).move_above(q2_a1)
+        Answer.objects.filter(pk__in=[q1_a2.pk, q1_a3.pk]).move_above(q1_a1)
+        self.assertSequenceEqual(
+            Answer.objects.values_list('pk', 'order'), [
+            (q1_a2.pk, 0), (q1_a3.pk, 1), (q1_a1.pk, 2), (q2_a1.pk, 0)
+        ])
+
+    def test_sparse(self):
+        items = [SparseItem.objects.create(name=str(i)) for i in range(9)]
+        before = dict(SparseItem.objects.values_list('pk', 'order'))
+        SparseItem.objects.filter(pk__in=[items[5].pk, items[7].pk]).to_top()
+        after = dict(SparseItem.objects.values_list('pk', 'order'))
+        # the two moved and the first object, which made room above it
+        self.assertEqual(len([pk for pk in after if after[pk] != before[pk]]), 3)
+        self.assertEqual([i.name for i in SparseItem.objects.all()],
+                         ['5', '7', '0', '1', '2', '3', '4', '6', '8'])
+
+    def test_ranked(self):
+        a, b, c, d = [RankedItem.objects.create(name=name) for name in 'abcd']
+        RankedItem.objects.filter(pk__in=[c.pk, d.pk]).move_above(b)
+        self.assertEqual(['a', 'c', 'd', 'b'], [i.name for i in RankedItem.objects.all()])
+        RankedItem.objects.filter(pk__in=[a.pk, c.pk]).to_bottom()
+        self.assertEqual(['d', 'b', 'a', 'c'], [i.name for i in RankedItem.objects.all()])
+
+
+class CompactTests(TestCase):
+    fixtures = ['test_items.json']
+
+    def test_compact(self):
+        self.assertEqual(Item.compact(), 2)
+        self.assertSequenceEqual(
+            Item.objects.values_list('name', 'order'), [
+            ('1', 0), ('2', 1), ('3', 2), ('4', 3)
+        ])
+        self.assertEqual(Item.compact(), 0)
+
+    def test_compact_with_respect_to(self):
+        q1 = Question.objects.create()
+        q2 = Question.objects.create()
+        q1_a1 = q1.answers.create()
+        q1_a2 = q1.answers.create()
+        q1_a3 = q1.answers.create()
+        q2_a1 = q2.answers.create()
+        q2_a2 = q2.answers.create()
+        q1_a2.delete()
+        q2_a1.delete()
+        self.assertEqual(Answer.compact(q1), 1)
+        self.assertSequenceEqual(
+            Answer.objects.values_list('pk', 'order'), [
+            (q1_a1.pk, 0), (q1_a3.pk, 1), (q2_a2.pk, 1)
+        ])
+        self.assertEqual(Answer.compact(), 1)
+        self.assertSequenceEqual(
+            Answer.objects.values_list('pk', 'order'), [
+            (q1_a1.pk, 0), (q1_a3.pk, 1), (q2_a2.pk, 0)
+        ])
+
+    def test_compact_order_step(self):
+        SparseItem.objects.bulk_create([SparseItem(name=str(i), order=i) for i in range(3)])
+        SparseItem.compact()
+        self.assertSequenceEqual(
+            SparseItem.objects.values_list('order', flat=True), [0, 100, 200])
+
+    def test_command(self):
+        from django.core.management import call_command
+        from django.utils.six import StringIO
+        out = StringIO()
+        call_command('compact_orders', 'tests.Item', stdout=out)
+        self.assertTrue(out.getvalue().startswith('Compacted tests.Item: 2 rows'))
+        self.assertSequenceEqual(
+            Item.objects.values_list('order', flat=True), [0, 1, 2, 3])
+
+
+class DeletePolicyTests(TestCase):
+
+    def setUp(self):
+        self.q1 = Question.objects.create()
+        self.q2 = Question.objects.create()
+        self.q1_answers = [self.q1.answers.create() for i in range(4)]
+        self.q2_answers = [self.q2.answers.create() for i in range(2)]
+
+    def tearDown(self):
+        Answer.order_delete_policy = 'leave'
+
+    def assertOrders(self, question, answers):
+        self.assertSequenceEqual(
+            question.answers.values_list('pk', 'order'),
+            [(answer.pk, order) for order, answer in enumerate(answers)])
+
+    def test_leave(self):
+        self.q1_answers[1].delete()
+        self.assertSequenceEqual(
+            self.q1.answers.values_list('order', flat=True), [0, 2, 3])
+
+    def test_eager(self):
+        Answer.order_delete_policy = 'eager'
+        a1, a2, a3, a4 = self.q1_answers
+        a2.delete()
+        self.assertOrders(self.q1, [a1, a3, a4])
+        self.assertOrders(self.q2, self.q2_answers)
+
+    def test_eager_queryset(self):
+        Answer.order_delete_policy = 'eager'
+        a1, a2, a3, a4 = self.q1_answers
+        Answer.objects.filter(pk__in=[a1.pk, a3.pk, self.q2_answers[0].pk]).delete()
+        self.assertOrders(self.q1, [a2, a4])
+        self.assertOrders(self.q2, self.q2_answers[1:])
+
+    def test_lazy(self):
+        Answer.order_delete_policy = 'lazy'
+        a1, a2, a3, a4 = self.q1_answers
+        Answer.objects.filter(pk__in=[a1.pk, a3.pk]).delete()
+        a5 = self.q1.answers.create()
+        self.assertSequenceEqual(
+            self.q1.answers.values_list('order', flat=True), [1, 3, 4])
+        self.assertEqual(Answer.fragmented_stacks(), [(self.q1.pk,)])
+        # the stacks, then PostgreSQL renumbers the fragmented one in one
+        # statement where others read and write it
+        from django.db import connection
+        with self.assertNumQueries(2 if connection.vendor == 'postgresql' else 3):
+            self.assertEqual(Answer.compact(fragmented=True), 3)
+        self.assertOrders(self.q1, [a2, a4, a5])
+        self.assertOrders(self.q2, self.q2_answers)
+        self.assertEqual(Answer.fragmented_stacks(), [])
+
+    def test_lazy_command(self):
+        from django.core.management import call_command
+        from django.utils.six import StringIO
+        Answer.order_delete_policy = 'lazy'
+        self.q2_answers[0].delete()
+        out = StringIO()
+        call_command('compact_orders', 'tests.Answer', 'tests.RankedItem', fragmented=True, stdout=out)
+        self.assertEqual(out.getvalue().count('Compacted'), 1)
+        self.assertOrders(self.q2, self.q2_answers[1:])
+
+
+class QueryCountTests(TestCase):
+
+    def setUp(self):
+        self.items = [Item.objects.create(name=str(i)) for i in range(5)]
+
+    def assertNames(self, names):
+        self.assertSequenceEqual(Item.objects.values_list('name', flat=True), names)
+
+    def test_to(self):
+        with self.assertNumQueries(2):
+            self.items[3].to(1)
+        self.assertNames(['0', '3', '1', '2', '4'])
+
+    def test_above_moving_up(self):
+        item, ref = self.items[3], self.items[1]
+        with self.assertNumQueries(2):
+            item.above(ref)
+        self.assertNames(['0', '3', '1', '2', '4'])
+
+    def test_above_moving_down(self):
+        item, ref = self.items[1], self.items[3]
+        with self.assertNumQueries(2):
+            item.above(ref)
+        self.assertNames(['0', '2', '1', '3', '4'])
+
+    def test_below_moving_up(self):
+        item, ref = self.items[3], self.items[1]
+        with self.assertNumQueries(2):
+            item.below(ref)
+        self.assertNames(['0', '1', '3', '2', '4'])
+
+    def test_below_moving_down(self):
+        item, ref = self.items[1], self.items[3]
+        with self.assertNumQueries(2):
+            item.below(ref)
+        self.assertNames(['0', '2', '3', '1', '4'])
+
+    def test_above_with_gaps(self):
+        Item.objects.filter(name__in=['1', '2']).delete()
+        item, ref = self.items[0], self.items[4]
+        with self.assertNumQueries(2):
+            item.above(ref)
+        self.assertNames(['3', '0', '4'])
+
+    def test_save_order_signals(self):
+        from django.db.models.signals import pre_save, post_save
+        calls = []
+
+        def receiver(sender, instance, **kwargs):
+            calls.append((instance.pk, kwargs['update_fields']))
+        pre_save.connect(receiver, sender=Item)
+        post_save.connect(receiver, sender=Item)
+        try:
+            self.items[3].to(1)
+        finally:
+            pre_save.disconnect(receiver, sender=Item)
+            post_save.disconnect(receiver, sender=Item)
+        self.assertEqual(calls, [(self.items[3].pk, frozenset(['order']))] * 2)
+
+    def test_up_and_down(self):
+        with self.assertNumQueries(2):
+            self.items[2].up()
+        with self.assertNumQueries(2):
+            self.items[0].down()
+        self.assertNames(['2', '0', '1', '3', '4'])
+
+    def test_top_and_bottom(self):
+        with self.assertNumQueries(3):
+            self.items[2].top()
+        with self.assertNumQueries(3):
+            self.items[1].bottom()
+        self.assertNames(['2', '0', '3', '4', '1'])
+
+    def test_sparse_move(self):
+        items = [SparseItem.objects.create(name=str(i)) for i in range(3)]
+        with self.assertNumQueries(2):
+            items[2].below(items[0])
+        self.assertSequenceEqual(
+            SparseItem.objects.values_list('name', flat=True), ['0', '2', '1'])
+
+    def test_ranked_move(self):
+        items = [RankedItem.objects.create(name=str(i)) for i in range(3)]
+        with self.assertNumQueries(2):
+            items[2].above(items[0])
+        self.assertSequenceEqual(
+            RankedItem.objects.values_list('name', flat=True), ['2', '0', '1'])
+
+    def test_swap_signals(self):
+        from django.db.models.signals import post_save
+        calls = []
+
+        def receiver(sender, instance, **kwargs):
+            calls.append((instance.pk, instance.order, kwargs['update_fields']))
+        post_save.connect(receiver, sender=Item)
+        try:
+            self.items[2].up()
+        finally:
+            post_save.disconnect(receiver, sender=Item)
+        self.assertEqual(calls, [
+            (self.items[2].pk, 1, frozenset(['order'])),
+            (self.items[1].pk, 2, frozenset(['order'])),
+        ])
+
+
+class UniqueOrderTests(TestCase):
+
+    def setUp(self):
+        self.q1 = Question.objects.create()
+        self.q2 = Question.objects.create()
+        self.answers = [self.q1.unique_answers.create() for i in range(5)]
+        self.q2.unique_answers.create()
+
+    def tearDown(self):
+        UniqueAnswer.order_delete_policy = 'leave'
+
+    def assertAnswers(self, indexes):
+        self.assertSequenceEqual(
+            self.q1.unique_answers.values_list('pk', flat=True),
+            [self.answers[i].pk for i in indexes])
+
+    def answer(self, index):
+        return UniqueAnswer.objects.get(pk=self.answers[index].pk)
+
+    def test_order_is_unique(self):
+        self.assertTrue(UniqueAnswer._order_is_unique())
+        self.assertFalse(Answer._order_is_unique())
+
+    def test_swap(self):
+        self.answer(2).up()
+        self.answer(3).down()
+        self.assertAnswers([0, 2, 1, 4, 3])
+
+    def test_to(self):
+        self.answers[4].to(1)
+        self.assertAnswers([0, 4, 1, 2, 3])
+        self.answers[4].to(3)
+        self.assertAnswers([0, 1, 2, 4, 3])
+
+    def test_above_and_below(self):
+        self.answer(0).above(self.answer(3))
+        self.assertAnswers([1, 2, 0, 3, 4])
+        self.answer(4).below(self.answer(1))
+        self.assertAnswers([1, 4, 2, 0, 3])
+        self.answer(1).below(self.answer(0))
+        self.assertAnswers([4, 2, 0, 1, 3])
+        self.answer(3).above(self.answer(2))
+        self.assertAnswers([4, 3, 2, 0, 1])
+
+    def test_top_and_bottom(self):
+        self.answer(3).top()
+        self.answer(1).bottom()
+        self.assertAnswers([3, 0, 2, 4, 1])
+
+    def test_reorder(self):
+        UniqueAnswer.objects.reorder([a.pk for a in reversed(self.answers)])
+        self.assertAnswers([4, 3, 2, 1, 0])
+
+    def test_move_many(self):
+        UniqueAnswer.objects.filter(pk__in=[self.answers[3].pk, self.answers[4].pk]).move_above(self.answers[0])
+        self.assertAnswers([3, 4, 0, 1, 2])
+
+    def test_move_block_past_shifted(self):
+        # the others are shifted into the orders right above the parked block
+        pks = [self.answers[1].pk, self.answers[2].pk]
+        UniqueAnswer.objects.filter(pk__in=pks).move_below(self.answer(3))
+        self.assertAnswers([0, 3, 1, 2, 4])
+        UniqueAnswer.objects.filter(pk__in=pks).move_above(self.answer(0))
+        self.assertAnswers([1, 2, 0, 3, 4])
+        UniqueAnswer.objects.filter(pk__in=[self.answers[3].pk, self.answers[4].pk]).to_top()
+        self.assertAnswers([3, 4, 1, 2, 0])
+
+    def test_delete_eager(self):
+        UniqueAnswer.order_delete_policy = 'eager'
+        self.answers[1].delete()
+        UniqueAnswer.objects.filter(pk__in=[self.answers[0].pk, self.answers[3].pk]).delete()
+        self.assertSequenceEqual(
+            self.q1.unique_answers.values_list('pk', 'order'),
+            [(self.answers[2].pk, 0), (self.answers[4].pk, 1)])
+
+    def test_compact(self):
+        self.answers[1].delete()
+        self.answers[3].delete()
+        UniqueAnswer.compact()
+        self.assertSequenceEqual(
+            self.q1.unique_answers.values_list('order', flat=True), [0, 1, 2])
+
+    def test_check_order_constraint(self):
+        from ordered_model.constraints import check_order_constraint
+        self.assertEqual(check_order_constraint(Answer), [])
+        Answer.objects.create(question=self.q1)
+        Answer.objects.filter(pk=Answer.objects.create(question=self.q1).pk).update(order=0)
+        self.assertEqual(check_order_constraint(Answer), [
+            'tests.Answer: 2 objects have order 0 in the stack of question %s.' % self.q1.pk])
+
+    def test_check_orders_command(self):
+        from django.core.management import call_command
+        from django.core.management.base import CommandError
+        from django.utils.six import StringIO
+        out = StringIO()
+        call_command('check_orders', 'tests.Answer', stdout=out)
+        self.assertEqual(out.getvalue(), '')
+        Answer.objects.bulk_create([Answer(question=self.q1, order=0), Answer(question=self.q1, order=0)])
+        # Django 1.4 exits instead of raising the CommandError
+        self.assertRaises((CommandError, SystemExit), call_command, 'check_orders',
+                          stdout=out, stderr=StringIO())
+        self.assertTrue('tests.Answer: 2 objects have order 0' in out.getvalue())
+
+    def test_sql_create_order_constraint(self):
+        from django.db import connection
+        from ordered_model.constraints import sql_create_order_constraint
+        sql = sql_create_order_constraint(Answer)
+        self.assertEqual(len(sql), 1)
+        self.assertTrue('tests_answer_order_uniq' in sql[0])
+        self.assertTrue('%s, %s' % (connection.ops.quote_name('question_id'),
+                                    connection.ops.quote_name('order')) in sql[0])
+
+    def test_deferrable_constraint(self):
+        from django.db import connection
+        from ordered_model.constraints import add_order_constraint
+        if connection.vendor != 'postgresql':
+            return
+        Answer.order_constraint_deferrable = True
+        try:
+            add_order_constraint(Answer)
+            answers = [self.q2.answers.create() for i in range(3)]
+            # SET CONSTRAINTS, the shift and the moved object
+            with self.assertNumQueries(3):
+                answers[2].to(0)
+            Answer.objects.get(pk=answers[0].pk).up()
+        finally:
+            del Answer.order_constraint_deferrable
+        self.assertSequenceEqual(
+            self.q2.answers.values_list('pk', flat=True),
+            [answers[0].pk, answers[2].pk, answers[1].pk])
+
+
+class OrderIndexTests(TestCase):
+
+    def index_columns(self, model):
+        from django.db import connection
+        cursor = connection.cursor()
+        table = model._meta.db_table
+        if connection.vendor == 'sqlite':
+            cursor.execute('PRAGMA index_list(%s)' % connection.ops.quote_name(table))
+            indexes = [row[1] for row in cursor.fetchall()]
+            columns = []
+            for index in indexes:
+                cursor.execute('PRAGMA index_info(%s)' % connection.ops.quote_name(index))
+                columns.append(tuple(row[2] for row in cursor.fetchall()))
+            return columns
+        if connection.vendor == 'postgresql':
+            cursor.execute('SELECT indexdef FROM pg_indexes WHERE tablename = %s', [table])
+            return [tuple(column.strip(' "') for column in row[0].split('(')[1].rstrip(')').split(','))
+                    for row in cursor.fetchall()]
+
+    def test_composite_index(self):
+        columns = self.index_columns(Answer)
+        if columns is not None:
+            self.assertTrue(('question_id', 'order') in columns)
+            self.assertEqual(self.index_columns(UniqueAnswer).count(('question_id', 'order')), 1)
+
+    def test_index_together(self):
+        if not hasattr(Answer._meta, 'index_together'):  # Django < 1.5
+            return
+        self.assertTrue(('question', 'order') in Answer._meta.index_together)
+        self.assertFalse(('question', 'order') in UniqueAnswer._meta.index_together)
+        self.assertEqual(Item._meta.index_together, [])
+
+
+class MultiFieldOrderWithRespectToTests(TestCase):
+
+    def setUp(self):
+        self.board = Board.objects.create()
+        self.todo = [Card.objects.create(board=self.board, column='todo') for i in range(3)]
+        self.done = [Card.objects.create(board=self.board, column='done') for i in range(2)]
+
+    def test_orders_per_stack(self):
+        self.assertSequenceEqual(
+            Card.objects.filter(column='todo').values_list('order', flat=True), [0, 1, 2])
+        self.assertSequenceEqual(
+            Card.objects.filter(column='done').values_list('order', flat=True), [0, 1])
+        other = Card.objects.create(board=Board.objects.create(), column='todo')
+        self.assertEqual(other.order, 0)
+
+    def test_move_without_related_fetch(self):
+        card = Card.objects.get(pk=self.todo[2].pk)
+        with self.assertNumQueries(2):
+            card.up()
+        ref = Card.objects.get(pk=self.todo[0].pk)
+        with self.assertNumQueries(2):
+            card.above(ref)
+        self.assertSequenceEqual(
+            Card.objects.filter(column='todo').values_list('pk', flat=True),
+            [self.todo[2].pk, self.todo[0].pk, self.todo[1].pk])
+
+    def test_reference_in_other_stack(self):
+        self.assertRaises(ValueError, self.todo[0].above, self.done[0])
+
+    def test_bulk_create(self):
+        cards = Card.objects.bulk_create([
+            Card(board=self.board, column='done'), Card(board=self.board, column='todo'),
+            Card(board=self.board, column='new'),
+        ])
+        self.assertEqual([card.order for card in cards], [2, 3, 0])
+
+    def test_compact_stack(self):
+        self.todo[1].delete()
+        self.done[0].delete()
+        self.assertEqual(Card.compact((self.board, 'todo')), 1)
+        self.assertSequenceEqual(
+            Card.objects.values_list('column', 'order'), [('done', 1), ('todo', 0), ('todo', 1)])
+
+    def test_index_together(self):
+        if hasattr(Card._meta, 'index_together'):  # Django >= 1.5
+            self.assertTrue(('board', 'column', 'order') in Card._meta.index_together)
+
+
+class OrderingScopeTests(TestCase):
+
+    def setUp(self):
+        q1 = Question.objects.create()
+        q2 = Question.objects.create()
+        self.a1 = Answer.objects.get(pk=q1.answers.create().pk)
+        self.a2 = Answer.objects.get(pk=q1.answers.create().pk)
+        self.b1 = Answer.objects.get(pk=q2.answers.create().pk)
+
+    def test_valid_ordering_reference_without_related_fetch(self):
+        with self.assertNumQueries(0):
+            self.assertTrue(self.a1._valid_ordering_reference(self.a2))
+            self.assertFalse(self.a1._valid_ordering_reference(self.b1))
+            self.a1.get_ordering_queryset()
+
+    def test_invalid_reference_message(self):
+        with self.assertNumQueries(0):
+            try:
+                self.a1.above(self.b1)
+            except ValueError as e:
+                self.assertTrue('which question_id equals %r' % self.a1.question_id in str(e))
+            else:
+                self.fail('ValueError not raised')
+
+    def test_inline_links_without_related_fetch(self):
+        from django.contrib import admin
+        from ordered_model.tests.admin import PizzaToppingsThroughModelInline
+        pizza = Pizza.objects.create(name='Margherita')
+        topping = Topping.objects.create(name='Basil')
+        PizzaToppingsThroughModel.objects.create(pizza=pizza, topping=topping)
+        obj = PizzaToppingsThroughModel.objects.get()
+        inline = PizzaToppingsThroughModelInline(Pizza, admin.site)
+        with self.assertNumQueries(0):
+            links = inline.move_up_down_links(obj)
+        self.assertTrue('/admin/tests/pizza/%d/pizzatoppingsthroughmodel/%d/move-up/' % (
+            pizza.pk, obj.pk) in links)
+
+
+class OrderCacheTests(TestCase):
+
+    def setUp(self):
+        from ordered_model.cache import LRUCache
+        Answer.order_cache = LRUCache()
+        self.q1 = Question.objects.create()
+        self.q2 = Question.objects.create()
+        self.answers = [self.q1.answers.create() for i in range(4)]
+        self.other = self.q2.answers.create()
+
+    def tearDown(self):
+        Answer.order_cache = None
+
+    def answer(self, index):
+        return Answer.objects.get(pk=self.answers[index].pk)
+
+    def test_without_cache(self):
+        Answer.order_cache = None
+        answer = self.answer(2)
+        self.assertEqual(answer.get_position(), 2)
+        self.assertEqual(answer.get_next(), self.answers[3])
+        self.assertEqual(answer.get_previous(), self.answers[1])
+        self.assertEqual(answer.count_in_group(), 4)
+        self.assertEqual(self.answer(0).get_previous(), None)
+        self.assertEqual(self.answer(3).get_next(), None)
+
+    def test_cache_hit(self):
+        answer = self.answer(2)
+        with self.assertNumQueries(1):
+            self.assertEqual(answer.get_position(), 2)
+        with self.assertNumQueries(0):
+            self.assertEqual(answer.get_position(), 2)
+            self.assertEqual(answer.count_in_group(), 4)
+        self.assertEqual(self.other.count_in_group(), 1)
+        with self.assertNumQueries(1):
+            self.assertEqual(answer.get_next(), self.answers[3])
+        self.assertEqual(self.answer(0).get_previous(), None)
+        self.assertEqual(self.answer(3).get_next(), None)
+
+    def test_invalidated_by_moves(self):
+        answer = self.answer(2)
+        self.assertEqual(answer.get_position(), 2)
+        answer.up()
+        self.assertEqual(answer.get_position(), 1)
+        answer.to(3)
+        self.assertEqual(answer.get_position(), 3)
+        self.answer(0).swap([self.answer(1)])
+        self.assertEqual(self.answer(0).get_position(), 1)
+
+    def test_invalidated_by_insert_and_delete(self):
+        answer = self.answer(3)
+        self.assertEqual(answer.count_in_group(), 4)
+        self.q1.answers.create()
+        self.assertEqual(answer.count_in_group(), 5)
+        self.answer(0).delete()
+        self.assertEqual(answer.get_position(), 2)
+        Answer.objects.filter(pk=self.answers[1].pk).delete()
+        self.assertEqual(answer.get_position(), 1)
+        Answer.objects.bulk_create([Answer(question=self.q1)])
+        self.assertEqual(answer.count_in_group(), 4)
+
+    def test_invalidated_by_queryset_moves(self):
+        answer = self.answer(3)
+        self.assertEqual(answer.get_position(), 3)
+        Answer.objects.reorder([a.pk for a in reversed(self.answers)])
+        self.assertEqual(answer.get_position(), 0)
+        Answer.objects.filter(pk=answer.pk).to_bottom()
+        self.assertEqual(answer.get_position(), 3)
+
+    def test_django_cache(self):
+        from django.core.cache import get_cache
+        Answer.order_cache = 'default'
+        get_cache('default').clear()
+        answer = self.answer(1)
+        self.assertEqual(answer.get_position(), 1)
+        with self.assertNumQueries(0):
+            self.assertEqual(answer.get_position(), 1)
+        answer.down()
+        self.assertEqual(answer.get_position(), 2)
+
+
+class KeysetPaginationTests(TestCase):
+
+    def setUp(self):
+        self.q1 = Question.objects.create()
+        self.q2 = Question.objects.create()
+        self.answers = [self.q1.answers.create() for i in range(3)] + [self.q2.answers.create() for i in range(3)]
+
+    def test_after_and_before(self):
+        a = self.answers
+        self.assertEqual(list(Answer.objects.after(a[1])), a[2:])
+        self.assertEqual(list(Answer.objects.after(a[2].pk)), a[3:])
+        self.assertEqual(list(Answer.objects.before(a[4])), [a[3], a[2], a[1], a[0]])
+        self.assertEqual(list(self.q1.answers.after(a[0])), a[1:3])
+        self.assertEqual(list(Answer.objects.after(a[5])), [])
+
+    def test_ties_are_broken_by_pk(self):
+        Answer.objects.filter(question=self.q2).update(order=0)
+        a = self.answers
+        self.assertEqual(list(Answer.objects.after(a[3].pk)), a[4:])
+        self.assertEqual(list(Answer.objects.before(a[5].pk)), [a[4], a[3], a[2], a[1], a[0]])
+
+    def test_paginator(self):
+        from ordered_model.paginator import KeysetPaginator
+        paginator = KeysetPaginator(Answer.objects.all(), 4)
+        page = paginator.page()
+        self.assertEqual(list(page), self.answers[:4])
+        self.assertTrue(page.has_next())
+        self.assertFalse(page.has_previous())
+        # the row of the cursor and the page
+        with self.assertNumQueries(2):
+            page = paginator.page(after=page.next_cursor())
+        self.assertEqual(list(page), self.answers[4:])
+        self.assertFalse(page.has_next())
+        self.assertTrue(page.has_previous())
+        page = paginator.page(before=page.previous_cursor())
+        self.assertEqual(list(page), self.answers[:4])
+        self.assertFalse(page.has_previous())
+        self.assertEqual(paginator.count, 6)
+
+    def test_invalid_cursor(self):
+        from django.core.paginator import EmptyPage
+        from ordered_model.paginator import KeysetPaginator
+        paginator = KeysetPaginator(Answer.objects.all(), 4)
+        self.assertRaises(EmptyPage, paginator.page, after=0)
+        self.assertRaises(EmptyPage, paginator.page, after='x')
+
+    def test_admin_changelist(self):
+        from django.contrib import admin
+        from django.test.client import RequestFactory
+        from ordered_model.paginator import KeysetPaginator
+        from ordered_model.tests.admin import ItemAdmin
+
+        class KeysetItemAdmin(ItemAdmin):
+            paginator = KeysetPaginator
+            list_per_page = 2
+
+        items = [Item.objects.create(name=str(i)) for i in range(5)]
+        model_admin = KeysetItemAdmin(Item, admin.site)
+        self.assertEqual(model_admin.change_list_template, 'ordered_model/admin/keyset_change_list.html')
+        request = RequestFactory().get('/admin/tests/item/', {'after': items[1].pk})
+        cl = model_admin._get_changelist(request)
+        self.assertEqual(list(cl.result_list), items[2:4])
+        self.assertEqual(cl.result_count, 5)
+        self.assertEqual(cl.get_next_page_url(), '?after=%d' % items[3].pk)
+        self.assertEqual(cl.get_previous_page_url(), '?before=%d' % items[2].pk)
+        self.assertEqual(request.GET['after'], str(items[1].pk))
+
+        from django.contrib.auth.models import User
+        request.user = User.objects.create_superuser('admin', 'admin@example.com', 'admin')
+        response = model_admin.changelist_view(request)
+        response.render()
+        self.assertTrue('href="?before=%d"' % items[2].pk in response.content.decode('utf-8'))
+
+
+class IterOrderedTests(TestCase):
+
+    def setUp(self):
+        self.q1 = Question.objects.create()
+        self.q2 = Question.objects.create()
+        self.answers = [self.q1.answers.create() for i in range(5)] + [self.q2.answers.create() for i in range(3)]
+
+    def test_iterates_in_chunks(self):
+        with self.assertNumQueries(3):
+            self.assertEqual(list(Answer.objects.iter_ordered(chunk_size=3)), self.answers)
+        with self.assertNumQueries(3):
+            self.assertEqual(list(Answer.objects.iter_ordered(chunk_size=4)), self.answers)
+
+    def test_group(self):
+        self.assertEqual(list(Answer.objects.iter_ordered(self.q1, chunk_size=2)), self.answers[:5])
+        self.assertEqual(list(Answer.objects.iter_ordered(self.q2.pk, chunk_size=2)), self.answers[5:])
+        self.assertEqual(list(self.q2.answers.iter_ordered(chunk_size=2)), self.answers[5:])
+
+    def test_values(self):
+        rows = list(Answer.objects.iter_ordered(chunk_size=3, values=['id']))
+        self.assertEqual(rows, [{'id': answer.pk} for answer in self.answers])
+
+    def test_lazy(self):
+        answers = Answer.objects.iter_ordered(chunk_size=2)
+        with self.assertNumQueries(1):
+            self.assertEqual(next(answers), self.answers[0])
+            self.assertEqual(next(answers), self.answers[1])
+        answers.close()
+
+
+class IterOrderedSnapshotTests(TransactionTestCase):
+
+    def test_snapshot(self):
+        from django.db import connection
+        items = [Item.objects.create(name=str(i)) for i in range(3)]
+        iterator = Item.objects.iter_ordered(chunk_size=2)
+        self.assertEqual(next(iterator), items[0])
+        if connection.vendor == 'postgresql' and hasattr(connection, 'in_atomic_block'):
+            self.assertTrue(connection.in_atomic_block)
+        self.assertEqual(list(iterator), items[1:])
+        self.assertFalse(getattr(connection, 'in_atomic_block', False))
+
+
+class ReorderViewTests(TestCase):
+
+    def setUp(self):
+        from django.contrib import admin
+        from django.contrib.auth.models import User
+        from ordered_model.tests.admin import ItemAdmin
+        self.user = User.objects.create_superuser('admin', 'admin@example.com', 'admin')
+        self.model_admin = ItemAdmin(Item, admin.site)
+        self.items = [Item.objects.create(name=str(i)) for i in range(5)]
+
+    def post(self, data):
+        import json
+        from django.test.client import RequestFactory
+        request = RequestFactory().post('/admin/tests/item/reorder/', data)
+        request.user = self.user
+        response = self.model_admin.reorder_view(request)
+        return response.status_code, json.loads(response.content.decode('utf-8'))
+
+    def names(self):
+        return list(Item.objects.values_list('name', flat=True))
+
+    def test_url(self):
+        from django.core.urlresolvers import reverse
+        self.assertEqual(reverse('admin:tests_item_reorder'), '/admin/tests/item/reorder/')
+
+    def test_ids(self):
+        i = self.items
+        status, data = self.post({'ids': [i[3].pk, i[1].pk, i[2].pk]})
+        self.assertEqual(status, 200)
+        self.assertEqual(data, {'orders': {str(i[3].pk): 1, str(i[1].pk): 2, str(i[2].pk): 3}})
+        self.assertEqual(self.names(), ['0', '3', '1', '2', '4'])
+
+    def test_position(self):
+        i = self.items
+        status, data = self.post({'object': i[4].pk, 'position': 1})
+        self.assertEqual(status, 200)
+        self.assertEqual(data, {'orders': {str(i[4].pk): 1, str(i[1].pk): 2, str(i[2].pk): 3, str(i[3].pk): 4}})
+        self.assertEqual(self.names(), ['0', '4', '1', '2', '3'])
+        status, data = self.post({'object': i[4].pk, 'position': 4})
+        self.assertEqual(self.names(), ['0', '1', '2', '3', '4'])
+        status, data = self.post({'object': i[2].pk, 'position': 10})
+        self.assertEqual(self.names(), ['0', '1', '3', '4', '2'])
+
+    def test_position_sparse(self):
+        from django.contrib import admin
+        from ordered_model.admin import OrderedModelAdmin
+        self.model_admin = OrderedModelAdmin(SparseItem, admin.site)
+        a, b, c = [SparseItem.objects.create(name=name) for name in 'abc']
+        # a is moved to make room above it, b keeps its order
+        status, data = self.post({'object': c.pk, 'position': 0})
+        self.assertEqual(data, {'orders': {str(c.pk): 32, str(a.pk): 65}})
+        status, data = self.post({'object': a.pk, 'position': 2})
+        self.assertEqual(data, {'orders': {str(a.pk): 200}})
+
+    def test_position_ranked(self):
+        from django.contrib import admin
+        from ordered_model.admin import OrderedModelAdmin
+        self.model_admin = OrderedModelAdmin(RankedItem, admin.site)
+        a, b, c = [RankedItem.objects.create(name=name) for name in 'abc']
+        status, data = self.post({'object': c.pk, 'position': 1})
+        self.assertEqual(data, {'orders': {str(c.pk): RankedItem.objects.get(pk=c.pk).order}})
+        self.assertEqual(list(RankedItem.objects.values_list('name', flat=True)), ['a', 'c', 'b'])
+        status, data = self.post({'object': c.pk, 'position': 1})
+        self.assertEqual(data, {'orders': {}})
+
+    def test_errors(self):
+        from django.test.client import RequestFactory
+        self.assertEqual(self.post({'object': self.items[0].pk})[0], 400)
+        self.assertEqual(self.post({'object': self.items[0].pk, 'position': -1})[0], 400)
+        self.assertEqual(self.post({'ids': [self.items[0].pk, 0]})[0], 400)
+        request = RequestFactory().get('/admin/tests/item/reorder/')
+        request.user = self.user
+        self.assertEqual(self.model_admin.reorder_view(request).status_code, 405)
+
+
+class MoveViewTests(TestCase):
+
+    def setUp(self):
+        from django.contrib.auth.models import User
+        self.user = User.objects.create_superuser('admin', 'admin@example.com', 'admin')
+
+    def request(self, path, data=None):
+        from django.test.client import RequestFactory
+        request = RequestFactory().get(path, data or {})
+        request.user = self.user
+        return request
+
+    def test_query_count_independent_of_size(self):
+        from django.contrib import admin
+        from ordered_model.tests.admin import ItemAdmin
+        model_admin = ItemAdmin(Item, admin.site)
+        for size in (3, 200):
+            Item.objects.all().delete()
+            Item.objects.bulk_create([Item(name=str(i)) for i in range(size)])
+            item = Item.objects.get(name='1')
+            request = self.request('/admin/tests/item/%d/move-up/' % item.pk)
+            # the object, its neighbour and the update of both
+            with self.assertNumQueries(3):
+                model_admin.move_view(request, str(item.pk), 'up')
+            self.assertEqual(Item.objects.get(pk=item.pk).order, 0)
+
+    def test_redirect_keeps_filters(self):
+        from django.contrib import admin
+        from ordered_model.tests.admin import ItemAdmin
+        items = [Item.objects.create(name=str(i)) for i in range(2)]
+        model_admin = ItemAdmin(Item, admin.site)
+        request = self.request('/admin/tests/item/%d/move-down/' % items[0].pk, {'name': '0'})
+        response = model_admin.move_view(request, str(items[0].pk), 'down')
+        self.assertEqual(response['Location'], '../../?name=0')
+        self.assertEqual(list(Item.objects.values_list('name', flat=True)), ['1', '0'])
+        response = model_admin.move_view(self.request('/'), str(items[0].pk), 'up')
+        self.assertEqual(response['Location'], '../../')
+
+    def test_permission(self):
+        from django.contrib import admin
+        from django.contrib.auth.models import User
+        from django.core.exceptions import PermissionDenied
+        from ordered_model.tests.admin import ItemAdmin, PizzaToppingsThroughModelInline
+        item = Item.objects.create(name='0')
+        request = self.request('/')
+        request.user = User.objects.create_user('staff', 'staff@example.com', 'staff')
+        self.assertRaises(PermissionDenied, ItemAdmin(Item, admin.site).move_view, request, str(item.pk), 'up')
+        self.assertRaises(PermissionDenied, PizzaToppingsThroughModelInline.move_view, request, '1', '1', 'up')
+
+    def test_inline(self):
+        from ordered_model.tests.admin import PizzaToppingsThroughModelInline
+        pizza = Pizza.objects.create(name='Margherita')
+        toppings = [PizzaToppingsThroughModel.objects.create(pizza=pizza, topping=Topping.objects.create(name=name))
+                    for name in ('Basil', 'Tomato')]
+        request = self.request('/')
+        with self.assertNumQueries(3):
+            response = PizzaToppingsThroughModelInline.move_view(request, str(pizza.pk), str(toppings[1].pk), 'up')
+        self.assertEqual(response['Location'], '../../../')
+        self.assertEqual([t.topping.name for t in pizza.pizzatoppingsthroughmodel_set.order_by('order')],
+                         ['Tomato', 'Basil'])
+
+
+class OrderControlsTests(TestCase):
+
+    def setUp(self):
+        from django.contrib import admin
+        from ordered_model.tests.admin import ItemAdmin
+        self.model_admin = ItemAdmin(Item, admin.site)
+        self.items = [Item(pk=pk, name=str(pk), order=pk) for pk in range(1, 1001)]
+
+    def render(self, obj):
+        from django.core.urlresolvers import reverse
+        from django.template.loader import render_to_string
+        return render_to_string("ordered_model/admin/order_controls.html", {
+            'object_id': obj.pk,
+            'urls': {
+                'up': reverse('admin:tests_item_order_up', args=[obj.pk, 'up']),
+                'down': reverse('admin:tests_item_order_down', args=[obj.pk, 'down']),
+            },
+            'query_string': self.model_admin.request_query_string,
+        })
+
+    def test_same_as_rendered(self):
+        self.model_admin.request_query_string = '?name=a&o=1'
+        try:
+            for obj in self.items[:3]:
+                self.assertEqual(self.model_admin.move_up_down_links(obj), self.render(obj))
+        finally:
+            del self.model_admin.request_query_string
+
+    def test_inline(self):
+        from django.contrib import admin
+        from ordered_model.tests.admin import PizzaToppingsThroughModelInline
+        inline = PizzaToppingsThroughModelInline(Pizza, admin.site)
+        links = inline.move_up_down_links(PizzaToppingsThroughModel(pk=7, pizza_id=3))
+        self.assertTrue('/admin/tests/pizza/3/pizzatoppingsthroughmodel/7/move-down/' in links)
+        self.assertTrue('data-id="7"' in links)
+        self.assertEqual(inline.move_up_down_links(PizzaToppingsThroughModel(pizza_id=3)), '')
+
+    def test_1000_rows(self):
+        # the time taken is measured by the 'controls' benchmark
+        self.model_admin.request_query_string = '?o=1'
+        try:
+            self.model_admin.move_up_down_links(self.items[0])
+            with self.assertNumQueries(0):
+                links = [self.model_admin.move_up_down_links(obj) for obj in self.items]
+            self.assertEqual(links, [self.render(obj) for obj in self.items])
+        finally:
+            del self.model_admin.request_query_string
+
+
+class OrderChangedSignalTests(TestCase):
+
+    def setUp(self):
+        from ordered_model.signals import order_changed
+        self.events = []
+        order_changed.connect(self.receive)
+        self.question = Question.objects.create()
+
+    def tearDown(self):
+        from ordered_model.signals import order_changed
+        order_changed.disconnect(self.receive)
+
+    def receive(self, sender, **kwargs):
+        kwargs['sender'] = sender
+        self.events.append(kwargs)
+
+    def test_insert(self):
+        answer = self.question.answers.create()
+        event, = self.events
+        self.assertEqual(event['sender'], Answer)
+        self.assertEqual(event['instance'], answer)
+        self.assertEqual(event['operation'], 'insert')
+        self.assertEqual(event['group'], (self.question.pk,))
+        self.assertEqual((event['old_order'], event['new_order']), (None, 0))
+        self.assertEqual(event['rows_written'], 1)
+        # the maximum order and the insert
+        self.assertEqual(event['statements'], 2)
+        self.assertTrue(event['elapsed'] >= 0)
+        answer.save()
+        self.assertEqual(len(self.events), 1)
+
+    def test_moves(self):
+        answers = [self.question.answers.create() for i in range(4)]
+        del self.events[:]
+        answers[3].to(1)
+        answers[0].down()
+        Answer.objects.get(pk=answers[2].pk).top()
+        self.assertEqual([(e['operation'], e['old_order'], e['new_order'], e['rows_written'])
+                          for e in self.events],
+                         [('to', 3, 1, 3), ('swap', 0, 1, 2), ('top', 3, 0, 4)])
+
+    def test_delete(self):
+        answer = self.question.answers.create()
+        Answer.order_delete_policy = 'eager'
+        try:
+            self.question.answers.create()
+            answer.delete()
+        finally:
+            del Answer.order_delete_policy
+        event = self.events[-1]
+        self.assertEqual((event['operation'], event['old_order'], event['new_order']), ('delete', 0, None))
+        self.assertEqual(event['rows_written'], 2)
+
+    def test_query_log_untouched(self):
+        from django.db import connection
+        with self.assertNumQueries(2):
+            self.question.answers.create()
+        self.assertEqual(self.events[-1]['statements'], 2)
+        self.assertFalse(connection.use_debug_cursor)
+        self.assertFalse('make_debug_cursor' in connection.__dict__)
+
+    def test_query_log_kept_with_debug(self):
+        from django.db import connection, reset_queries
+        from django.test.utils import override_settings
+        with override_settings(DEBUG=True):
+            reset_queries()
+            self.question.answers.create()
+            self.assertEqual(len(connection.queries), 2)
+        self.assertEqual(self.events[-1]['statements'], 2)
+
+
+class MoveToGroupTests(TestCase):
+
+    def setUp(self):
+        self.q1 = Question.objects.create()
+        self.q2 = Question.objects.create()
+        self.a = [self.q1.answers.create() for i in range(4)]
+        self.b = [self.q2.answers.create() for i in range(3)]
+
+    def stack(self, question, model=Answer):
+        return list(model.objects.filter(question=question).order_by('order').values_list('pk', 'order'))
+
+    def test_to_bottom(self):
+        a, b = self.a, self.b
+        answer = Answer.objects.get(pk=a[1].pk)
+        # the shift of the old stack, the maximum order and the write
+        with self.assertNumQueries(3):
+            answer.move_to_group(self.q2)
+        self.assertEqual((answer.question_id, answer.order), (self.q2.pk, 3))
+        self.assertEqual(self.stack(self.q1), [(a[0].pk, 0), (a[2].pk, 1), (a[3].pk, 2)])
+        self.assertEqual(self.stack(self.q2), [(b[0].pk, 0), (b[1].pk, 1), (b[2].pk, 2), (a[1].pk, 3)])
+
+    def test_to_position(self):
+        a, b = self.a, self.b
+        answer = Answer.objects.get(pk=a[0].pk)
+        # the shift of the old stack, the reference, the shift of the new stack and the write
+        with self.assertNumQueries(4):
+            answer.move_to_group(self.q2.pk, 1)
+        self.assertEqual(self.stack(self.q1), [(a[1].pk, 0), (a[2].pk, 1), (a[3].pk, 2)])
+        self.assertEqual(self.stack(self.q2), [(b[0].pk, 0), (a[0].pk, 1), (b[1].pk, 2), (b[2].pk, 3)])
+        Answer.objects.get(pk=a[1].pk).move_to_group(self.q2, 10)
+        self.assertEqual(self.stack(self.q2)[-1], (a[1].pk, 4))
+
+    def test_same_group(self):
+        answer = Answer.objects.get(pk=self.a[3].pk)
+        answer.move_to_group(self.q1, 0)
+        self.assertEqual(self.stack(self.q1)[0], (answer.pk, 0))
+        self.assertRaises(ValueError, answer.move_to_group, self.q2, -1)
+        self.assertRaises(ValueError, Item.objects.create(name='x').move_to_group, 1)
+
+    def test_unique(self):
+        q1, q2 = self.q1, self.q2
+        a = [q1.unique_answers.create() for i in range(3)]
+        b = [q2.unique_answers.create() for i in range(3)]
+        UniqueAnswer.objects.get(pk=a[0].pk).move_to_group(q2, 0)
+        UniqueAnswer.objects.get(pk=a[1].pk).move_to_group(q2)
+        self.assertEqual(self.stack(q1, UniqueAnswer), [(a[2].pk, 0)])
+        self.assertEqual(self.stack(q2, UniqueAnswer), [
+            (a[0].pk, 0), (b[0].pk, 1), (b[1].pk, 2), (b[2].pk, 3), (a[1].pk, 4)])
+        UniqueAnswer.objects.filter(pk__in=[b[0].pk, b[2].pk]).move_to_group(q1, 0)
+        self.assertEqual(self.stack(q1, UniqueAnswer), [(b[0].pk, 0), (b[2].pk, 1), (a[2].pk, 2)])
+        self.assertEqual(self.stack(q2, UniqueAnswer), [(a[0].pk, 0), (b[1].pk, 1), (a[1].pk, 2)])
+        # some of the objects are in the new stack already
+        UniqueAnswer.objects.filter(pk__in=[b[0].pk, b[1].pk, a[1].pk]).move_to_group(q2)
+        self.assertEqual(self.stack(q1, UniqueAnswer), [(b[2].pk, 0), (a[2].pk, 1)])
+        self.assertEqual(self.stack(q2, UniqueAnswer), [
+            (a[0].pk, 0), (b[0].pk, 1), (b[1].pk, 2), (a[1].pk, 3)])
+
+    def test_within_group(self):
+        a, b = self.a, self.b
+        Answer.objects.filter(pk__in=[a[3].pk, b[1].pk, b[2].pk]).move_to_group(self.q2)
+        self.assertEqual(self.stack(self.q1), [(a[0].pk, 0), (a[1].pk, 1), (a[2].pk, 2)])
+        self.assertEqual(self.stack(self.q2), [(b[0].pk, 0), (a[3].pk, 1), (b[1].pk, 2), (b[2].pk, 3)])
+
+    def test_multiple_fields(self):
+        board = Board.objects.create()
+        todo = [board.cards.create(column='todo') for i in range(2)]
+        done = board.cards.create(column='done')
+        Card.objects.get(pk=todo[0].pk).move_to_group((board, 'done'), 0)
+        self.assertEqual(list(board.cards.filter(column='done').values_list('pk', 'order')),
+                         [(todo[0].pk, 0), (done.pk, 1)])
+        self.assertEqual(list(board.cards.filter(column='todo').values_list('pk', 'order')), [(todo[1].pk, 0)])
+
+    def test_bulk(self):
+        a, b = self.a, self.b
+        q3 = Question.objects.create()
+        c = q3.answers.create()
+        moved = Answer.objects.filter(pk__in=[a[1].pk, a[3].pk, b[0].pk])
+        moved.move_to_group(q3)
+        self.assertEqual(self.stack(self.q1), [(a[0].pk, 0), (a[2].pk, 1)])
+        self.assertEqual(self.stack(self.q2), [(b[1].pk, 0), (b[2].pk, 1)])
+        self.assertEqual(self.stack(q3), [(c.pk, 0), (a[1].pk, 1), (a[3].pk, 2), (b[0].pk, 3)])
+        Answer.objects.filter(pk__in=[a[3].pk, b[0].pk]).move_to_group(self.q1, 1)
+        self.assertEqual(self.stack(self.q1), [(a[0].pk, 0), (a[3].pk, 1), (b[0].pk, 2), (a[2].pk, 3)])
+        self.assertEqual(self.stack(q3), [(c.pk, 0), (a[1].pk, 1)])
+
+    def test_bulk_within_target(self):
+        a, b = self.a, self.b
+        Answer.objects.filter(pk__in=[a[0].pk, a[2].pk, b[1].pk]).move_to_group(self.q1)
+        self.assertEqual(self.stack(self.q1), [(a[1].pk, 0), (a[3].pk, 1), (a[0].pk, 2), (a[2].pk, 3), (b[1].pk, 4)])
+        self.assertEqual(self.stack(self.q2), [(b[0].pk, 0), (b[2].pk, 1)])
+
+
+class CreateAtTests(TestCase):
+
+    def setUp(self):
+        self.question = Question.objects.create()
+        self.answers = [self.question.answers.create() for i in range(3)]
+
+    def stack(self, model=Answer):
+        return list(model.objects.filter(question=self.question).order_by('order').values_list('pk', 'order'))
+
+    def test_create_at(self):
+        a = self.answers
+        # the neighbouring orders, the shift and the insert
+        with self.assertNumQueries(3):
+            answer = Answer.objects.create_at(1, question=self.question)
+        self.assertEqual(answer.order, 1)
+        self.assertEqual(self.stack(), [(a[0].pk, 0), (answer.pk, 1), (a[1].pk, 2), (a[2].pk, 3)])
+        first = Answer.objects.create_at(0, question=self.question)
+        self.assertEqual(self.stack()[:2], [(first.pk, 0), (a[0].pk, 1)])
+        last = Answer.objects.create_at(10, question=self.question)
+        self.assertEqual(self.stack()[-1], (last.pk, 5))
+        self.assertRaises(ValueError, Answer.objects.create_at, -1, question=self.question)
+
+    def test_create_at_sends_order_changed(self):
+        from ordered_model.signals import order_changed
+        events = []
+
+        def receive(sender, **kwargs):
+            events.append(kwargs)
+        order_changed.connect(receive)
+        try:
+            answer = Answer.objects.create_at(0, question=self.question)
+        finally:
+            order_changed.disconnect(receive)
+        event, = events
+        self.assertEqual((event['instance'], event['operation']), (answer, 'insert'))
+        self.assertEqual((event['old_order'], event['new_order']), (None, 0))
+        # the three shifted answers and the new one
+        self.assertEqual(event['rows_written'], 4)
+
+    def test_create_at_with_gaps(self):
+        self.answers[0].delete()
+        answer = Answer.objects.create_at(1, question=self.question)
+        self.assertEqual(self.stack(), [(self.answers[1].pk, 1), (answer.pk, 2), (self.answers[2].pk, 3)])
+
+    def test_bulk_create_at(self):
+        a = self.answers
+        new = [Answer(question=self.question) for i in range(3)]
+        with self.assertNumQueries(3):
+            Answer.objects.bulk_create_at(2, new)
+        self.assertEqual([answer.order for answer in new], [2, 3, 4])
+        self.assertEqual([order for pk, order in self.stack()], list(range(6)))
+        self.assertEqual([pk for pk, order in self.stack()][:2], [a[0].pk, a[1].pk])
+        self.assertEqual(self.stack()[-1], (a[2].pk, 5))
+        self.assertEqual(Answer.objects.bulk_create_at(0, []), [])
+        self.assertRaises(ValueError, Answer.objects.bulk_create_at, 0,
+                          [Answer(question=self.question), Answer(question=Question.objects.create())])
+
+    def test_unique(self):
+        u = [self.question.unique_answers.create() for i in range(3)]
+        UniqueAnswer.objects.bulk_create_at(0, [UniqueAnswer(question=self.question) for i in range(2)])
+        self.assertEqual([order for pk, order in self.stack(UniqueAnswer)], list(range(5)))
+        self.assertEqual([pk for pk, order in self.stack(UniqueAnswer)][2:], [obj.pk for obj in u])
+
+    def test_sparse_at_top(self):
+        items = [SparseItem.objects.create(name=str(i)) for i in range(5)]
+        written = 0
+        for i in range(3):
+            before = dict(SparseItem.objects.values_list('pk', 'order'))
+            item = SparseItem.objects.create_at(0, name='x%d' % i)
+            after = dict(SparseItem.objects.values_list('pk', 'order'))
+            written += len([pk for pk in before if after[pk] != before[pk]])
+            self.assertEqual(SparseItem.objects.all()[0], item)
+        # only the first object made room, once
+        self.assertEqual(written, 1)
+
+    def test_sparse_and_ranked(self):
+        items = [SparseItem.objects.create(name=str(i)) for i in range(2)]
+        # there is room between the orders, nothing is shifted
+        with self.assertNumQueries(2):
+            item = SparseItem.objects.create_at(1, name='x')
+        self.assertEqual(item.order, 50)
+        self.assertEqual(list(SparseItem.objects.values_list('order', flat=True)), [0, 50, 100])
+        ranked = [RankedItem.objects.create(name=str(i)) for i in range(2)]
+        new = [RankedItem(name='x'), RankedItem(name='y')]
+        RankedItem.objects.bulk_create_at(1, new)
+        self.assertEqual(list(RankedItem.objects.values_list('pk', flat=True)),
+                         [ranked[0].pk] + [obj.pk for obj in RankedItem.objects.filter(name__in='xy').order_by('order')] + [ranked[1].pk])
+        self.assertTrue(ranked[0].order < new[0].order < new[1].order < ranked[1].order)
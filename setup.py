@@ -11,6 +11,8 @@ setup(
     url='http://github.com/bfirsh/django-ordered-model/',
     packages=[
         'ordered_model',
+        'ordered_model.management',
+        'ordered_model.management.commands',
         'ordered_model.tests',
     ],
     classifiers=[
@@ -23,6 +25,9 @@ setup(
     ],
     package_data={'ordered_model': ['static/ordered_model/arrow-up.gif',
                                     'static/ordered_model/arrow-down.gif',
+                                    'static/ordered_model/js/reorder.js',
+                                    'templates/ordered_model/admin/order_controls.html',
+                                    'templates/ordered_model/admin/keyset_change_list.html',
                                     'locale/de/LC_MESSAGES/django.po',
                                     'locale/de/LC_MESSAGES/django.mo',
                                     'locale/pl/LC_MESSAGES/django.po',